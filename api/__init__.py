@@ -1 +1,6 @@
-from api.main import app
+from api.startup_timing import startup_timer
+
+with startup_timer.phase("env validation"):
+    import api.config.envs
+with startup_timer.phase("imports"):
+    from api.main import app
@@ -0,0 +1,144 @@
+from sqlmodel import SQLModel, insert, update, delete, bindparam, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import Column
+from sqlalchemy.ext.asyncio import AsyncConnection
+from starlette.requests import Request
+from typing import Any, AsyncGenerator, Iterable, Type
+import itertools
+import logging
+import json
+
+
+# per database, whether a multi-row INSERT is assigned consecutive auto-increment values
+_consecutive_auto_increment: dict[str, bool] = {}
+
+
+def get_primary_key(model: Type[SQLModel]) -> Column:
+    primary_key = list(model.__table__.primary_key.columns)     # type: ignore
+    if len(primary_key) != 1:
+        raise ValueError(f"Bulk operations need a single column primary key, {model.__name__} has {len(primary_key)}")
+    return primary_key[0]
+
+
+def batched(records: Iterable[Any], batch_size: int) -> Iterable[list]:
+    iterator = iter(records)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
+async def read_json_records(request: Request) -> AsyncGenerator[Any, None]:
+    """
+    Yields records of a JSON array body, or of an NDJSON body line by line
+    as it arrives, so large imports don't have to be held in memory at once.
+    Raises ValueError on malformed payloads.
+    """
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield _parse_json(line)
+        if buffer.strip():
+            yield _parse_json(buffer)
+        return
+
+    records = _parse_json(await request.body())
+    if not isinstance(records, list):
+        raise ValueError("Expected a JSON array or an NDJSON stream")
+    for record in records:
+        yield record
+
+
+def _parse_json(payload: bytes) -> Any:
+    try:
+        return json.loads(payload)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+
+
+async def has_consecutive_auto_increment(connection: AsyncConnection) -> bool:
+    """
+    MySQL assigns consecutive values to the rows of one INSERT only with an increment of 1
+    and when the lock mode doesn't interleave them with concurrent bulk inserts (mode 2).
+    Checked once per database.
+    """
+    url = connection.engine.url.render_as_string(hide_password=True)
+    if url not in _consecutive_auto_increment:
+        increment, lock_mode = (await connection.execute(
+            text("SELECT @@auto_increment_increment, @@innodb_autoinc_lock_mode")
+        )).one()
+        consecutive = int(increment) == 1 and int(lock_mode) != 2
+        if not consecutive:
+            logging.warning(f"auto_increment_increment={increment}, innodb_autoinc_lock_mode={lock_mode}: "
+                            f"bulk inserts read generated ids row by row")
+        _consecutive_auto_increment[url] = consecutive
+    return _consecutive_auto_increment[url]
+
+
+async def bulk_insert(db_session: AsyncSession, model: Type[SQLModel], rows: list[dict]) -> list[int]:
+    """
+    Inserts rows with a single multi-row INSERT and returns their generated primary keys
+    in the order of rows, without loading the objects back. Rows must not set the primary key.
+    """
+    if not rows:
+        return []
+    table = model.__table__     # type: ignore
+    primary_key = get_primary_key(model)
+    connection = await db_session.connection()
+
+    if connection.dialect.insert_returning:
+        result = await connection.execute(insert(table).values(rows).returning(primary_key))
+        # auto-increment values are assigned in the order of VALUES, RETURNING order is not guaranteed
+        return sorted(row[0] for row in result)
+
+    if connection.dialect.name == "mysql" and await has_consecutive_auto_increment(connection):
+        # MySQL has no RETURNING. Auto-increment values of a single multi-row INSERT are
+        # consecutive here and LAST_INSERT_ID() is the first of them.
+        result = await connection.execute(insert(table).values(rows))
+        return list(range(result.lastrowid, result.lastrowid + len(rows)))
+
+    ids = []
+    for row in rows:
+        result = await connection.execute(insert(table).values(row))
+        ids.append(result.inserted_primary_key[0])
+    return ids
+
+
+async def bulk_update(db_session: AsyncSession, model: Type[SQLModel], rows: list[dict]) -> int:
+    """
+    Updates rows by primary key with one executemany per set of updated fields.
+    Every row has to contain the primary key. Returns number of matched rows.
+    """
+    table = model.__table__     # type: ignore
+    primary_key = get_primary_key(model)
+    connection = await db_session.connection()
+
+    updated = 0
+    rows_by_fields: dict[tuple, list[dict]] = {}
+    for row in rows:
+        fields = tuple(sorted(field for field in row if field != primary_key.name))
+        if fields:
+            rows_by_fields.setdefault(fields, []).append(
+                {f"b_{field}": value for field, value in row.items()}
+            )
+
+    for fields, params in rows_by_fields.items():
+        statement = (
+            update(table)
+            .where(primary_key == bindparam(f"b_{primary_key.name}"))
+            .values({field: bindparam(f"b_{field}") for field in fields})
+        )
+        result = await connection.execute(statement, params)
+        updated += result.rowcount
+    return updated
+
+
+async def bulk_delete(db_session: AsyncSession, model: Type[SQLModel], ids: list[int]) -> int:
+    if not ids:
+        return 0
+    primary_key = get_primary_key(model)
+    connection = await db_session.connection()
+    result = await connection.execute(delete(model.__table__).where(primary_key.in_(ids)))    # type: ignore
+    return result.rowcount
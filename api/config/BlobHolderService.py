@@ -1,5 +1,23 @@
-from typing import cast
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, cast
 from typing_extensions import Self
+import threading
+import logging
+
+from api.config.envs import BLOB_SHARED_SNAPSHOT_PATH
+
+
+@dataclass(frozen=True)
+class BlobSnapshot:
+    name: str
+    content: str
+    version: int
+    etag: str | None = None
+    last_modified: datetime | None = None
+
+
+BlobChangeListener = Callable[[BlobSnapshot], None]
 
 
 class BlobHolderService:
@@ -9,10 +27,90 @@ class BlobHolderService:
         if not cls._instance:
             cls._instance = super().__new__(cls, *args, **kwargs)
             cls._instance._blob_cache = {}
+            cls._instance._listeners = {}
+            cls._instance._lock = threading.Lock()
+            cls._instance._shared_store = None
+            if BLOB_SHARED_SNAPSHOT_PATH:
+                # imported only when enabled, the store relies on POSIX file locks
+                from api.config.SharedBlobStore import SharedBlobStore
+                cls._instance._shared_store = SharedBlobStore(BLOB_SHARED_SNAPSHOT_PATH)
         return cast(Self, cls._instance)
 
-    def update_blob_content(self, blobname: str, content: str):
-        self._blob_cache[blobname] = content
+    def update_blob_content(self, blobname: str, content: str,
+                            etag: str | None = None, last_modified: datetime | None = None) -> bool:
+        """
+        Stores a new immutable snapshot of the blob. The version is bumped and listeners
+        are notified only when the content changed. Returns whether it changed.
+        With a shared store the snapshot is published to all processes of the host.
+        """
+        if self._shared_store is not None:
+            snapshot, changed = self._shared_store.publish(blobname, content, etag, last_modified)
+            self._apply_shared_snapshots([snapshot])
+            return changed
+
+        with self._lock:
+            current: BlobSnapshot | None = self._blob_cache.get(blobname)
+            if current is not None and current.content == content:
+                if etag is not None:
+                    self._blob_cache[blobname] = BlobSnapshot(
+                        blobname, content, current.version, etag, last_modified
+                    )
+                return False
+
+            snapshot = BlobSnapshot(
+                blobname, content, current.version + 1 if current else 1, etag, last_modified
+            )
+            self._blob_cache[blobname] = snapshot
+            listeners = list(self._listeners.get(blobname, []))
+
+        self._notify(snapshot, listeners)
+        return True
+
+    def _notify(self, snapshot: BlobSnapshot, listeners: list[BlobChangeListener]):
+        for listener in listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logging.error(f"Blob change listener failed for {snapshot.name}: {e}")
+
+    def _apply_shared_snapshots(self, snapshots: list[BlobSnapshot]):
+        with self._lock:
+            changed = []
+            for snapshot in snapshots:
+                current = self._blob_cache.get(snapshot.name)
+                self._blob_cache[snapshot.name] = snapshot
+                if current is None or current.version != snapshot.version or current.content != snapshot.content:
+                    changed.append((snapshot, list(self._listeners.get(snapshot.name, []))))
+        for snapshot, listeners in changed:
+            self._notify(snapshot, listeners)
+
+    def sync_shared_store(self):
+        """
+        Picks up snapshots published by other processes. Costs a read of the store
+        header when nothing changed, so it runs on every read.
+        """
+        if self._shared_store is None:
+            return
+        snapshots = self._shared_store.read_if_changed()
+        if snapshots:
+            self._apply_shared_snapshots(snapshots)
 
     def get_blob_content(self, blobname: str):
+        snapshot = self.get_snapshot(blobname)
+        return snapshot.content if snapshot else None
+
+    def get_snapshot(self, blobname: str) -> BlobSnapshot | None:
+        self.sync_shared_store()
         return self._blob_cache.get(blobname)
+
+    def add_change_listener(self, blobname: str, listener: BlobChangeListener):
+        """
+        Registers listener called with every new snapshot of the blob,
+        and right away with the current one if the blob is already loaded.
+        """
+        self.sync_shared_store()
+        with self._lock:
+            self._listeners.setdefault(blobname, []).append(listener)
+            current = self._blob_cache.get(blobname)
+        if current is not None:
+            self._notify(current, [listener])
@@ -0,0 +1,167 @@
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator
+import threading
+import struct
+import fcntl
+import logging
+import json
+import mmap
+import os
+
+from api.config.BlobHolderService import BlobSnapshot
+
+
+MAGIC = b"AZBS"
+# magic, layout version, sequence, payload length
+HEADER = struct.Struct("<4sIQQ")
+LAYOUT_VERSION = 1
+SEQUENCE_OFFSET = 8
+INITIAL_SIZE = 1024 * 1024
+
+
+class SharedBlobStore:
+    """
+    Blob snapshots shared by all processes of a host through a memory-mapped file.
+    The header holds a sequence number that writers make odd while writing and bump
+    to the next even number when done, so readers compare 8 bytes per request and only
+    decode the payload after it changed, retrying when a write was in progress.
+    Writers are serialized with an exclusive lock on the file. The lock is released
+    when a writer dies, so an odd sequence found while holding it is an abandoned
+    write. Its payload is discarded, processes keep their last snapshots until blobs are published again.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock = threading.Lock()
+        self._seen_sequence: int | None = None
+        with self._file_lock():
+            if os.fstat(self._fd).st_size < HEADER.size:
+                os.ftruncate(self._fd, INITIAL_SIZE)
+                self._map()
+                HEADER.pack_into(self._mmap, 0, MAGIC, LAYOUT_VERSION, 0, 0)
+            else:
+                self._map()
+                self._reset_abandoned_write()
+        magic, layout_version, _, _ = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or layout_version != LAYOUT_VERSION:
+            raise ValueError(f"{path} is not a shared blob store of layout version {LAYOUT_VERSION}")
+
+    def _map(self):
+        self._mmap = mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _reset_abandoned_write(self):
+        # has to run with the file lock held
+        sequence = struct.unpack_from("<Q", self._mmap, SEQUENCE_OFFSET)[0]
+        if sequence % 2:
+            logging.warning(f"Discarding a write to {self.path} abandoned by a dead process")
+            struct.pack_into("<Q", self._mmap, SEQUENCE_OFFSET + 8, 0)
+            struct.pack_into("<Q", self._mmap, SEQUENCE_OFFSET, sequence + 1)
+
+    def _recover_if_abandoned(self):
+        """
+        Called when a reader finds a write in progress. Doesn't wait for a live writer,
+        if the lock is free nobody is writing and the odd sequence is reset.
+        """
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        try:
+            self._reset_abandoned_write()
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _read_payload(self) -> tuple[int, dict[str, BlobSnapshot]] | None:
+        sequence, length = struct.unpack_from("<QQ", self._mmap, SEQUENCE_OFFSET)
+        if sequence % 2:
+            return None
+        if HEADER.size + length > len(self._mmap):
+            # grown by another process
+            self._map()
+        payload = self._mmap[HEADER.size:HEADER.size + length]
+        if struct.unpack_from("<Q", self._mmap, SEQUENCE_OFFSET)[0] != sequence:
+            return None
+        return sequence, decode_snapshots(payload)
+
+    def read_if_changed(self) -> list[BlobSnapshot] | None:
+        """
+        Snapshots of all blobs when the store changed since the last call, None otherwise
+        or when a write is in progress, in which case the next call picks it up.
+        """
+        with self._lock:
+            sequence = struct.unpack_from("<Q", self._mmap, SEQUENCE_OFFSET)[0]
+            if sequence == self._seen_sequence:
+                return None
+            result = self._read_payload()
+            if result is None:
+                self._recover_if_abandoned()
+                return None
+            self._seen_sequence, snapshots = result
+            return list(snapshots.values())
+
+    def publish(self, blobname: str, content: str, etag: str | None = None,
+                last_modified: datetime | None = None) -> tuple[BlobSnapshot, bool]:
+        """
+        Stores the blob content for all processes. Versions are shared, the version is bumped
+        only when the content differs from the stored one. Returns the stored snapshot
+        and whether the content changed.
+        """
+        with self._lock, self._file_lock():
+            self._reset_abandoned_write()
+            sequence, length = struct.unpack_from("<QQ", self._mmap, SEQUENCE_OFFSET)
+            if HEADER.size + length > len(self._mmap):
+                self._map()
+            snapshots = decode_snapshots(self._mmap[HEADER.size:HEADER.size + length])
+
+            current = snapshots.get(blobname)
+            if current is not None and current.content == content:
+                if etag is None or etag == current.etag:
+                    return current, False
+                version, changed = current.version, False
+            else:
+                version, changed = (current.version + 1 if current else 1), True
+            snapshots[blobname] = BlobSnapshot(blobname, content, version, etag, last_modified)
+
+            payload = encode_snapshots(snapshots)
+            if HEADER.size + len(payload) > len(self._mmap):
+                os.ftruncate(self._fd, max(2 * len(self._mmap), HEADER.size + len(payload)))
+                self._map()
+            # odd sequence tells readers the payload is being rewritten
+            struct.pack_into("<Q", self._mmap, SEQUENCE_OFFSET, sequence + 1)
+            self._mmap[HEADER.size:HEADER.size + len(payload)] = payload
+            struct.pack_into("<Q", self._mmap, SEQUENCE_OFFSET + 8, len(payload))
+            struct.pack_into("<Q", self._mmap, SEQUENCE_OFFSET, sequence + 2)
+            return snapshots[blobname], changed
+
+
+def encode_snapshots(snapshots: dict[str, BlobSnapshot]) -> bytes:
+    return json.dumps({
+        name: {
+            "content": snapshot.content,
+            "version": snapshot.version,
+            "etag": snapshot.etag,
+            "last_modified": snapshot.last_modified.isoformat() if snapshot.last_modified else None
+        }
+        for name, snapshot in snapshots.items()
+    }).encode("utf-8")
+
+
+def decode_snapshots(payload: bytes) -> dict[str, BlobSnapshot]:
+    if not payload:
+        return {}
+    return {
+        name: BlobSnapshot(
+            name, entry["content"], entry["version"], entry["etag"],
+            datetime.fromisoformat(entry["last_modified"]) if entry["last_modified"] else None
+        )
+        for name, entry in json.loads(payload).items()
+    }
@@ -27,7 +27,65 @@ DATABASE_CONNECTION_STRING: str = os.getenv("DATABASE_CONNECTION_STRING") or ""
 if not DATABASE_CONNECTION_STRING:
     raise Exception("No DATABASE_CONNECTION_STRING")
 
+# Optional, derived from DATABASE_CONNECTION_STRING when not set (mysql+pymysql -> mysql+aiomysql)
+DATABASE_ASYNC_CONNECTION_STRING: str = os.getenv("DATABASE_ASYNC_CONNECTION_STRING") or ""
+
+# Optional comma separated read replicas. GET requests and GraphQL queries read from them,
+# writes and everything after them in the same request stay on DATABASE_CONNECTION_STRING
+DATABASE_REPLICA_CONNECTION_STRINGS: list[str] = [
+    connection_string.strip()
+    for connection_string in (os.getenv("DATABASE_REPLICA_CONNECTION_STRINGS") or "").split(",")
+    if connection_string.strip()
+]
+# round_robin or least_busy (fewest connections checked out)
+DATABASE_REPLICA_SELECTION: str = os.getenv("DATABASE_REPLICA_SELECTION") or "round_robin"
+if DATABASE_REPLICA_SELECTION not in ("round_robin", "least_busy"):
+    raise Exception(f"Unknown DATABASE_REPLICA_SELECTION {DATABASE_REPLICA_SELECTION}")
+# Seconds replicas may lag behind the primary. For this long after a write of this process
+# sessions read from the primary, so they see the write and don't cache what a replica still returns
+DATABASE_REPLICA_LAG_SECONDS: float = float(os.getenv("DATABASE_REPLICA_LAG_SECONDS") or 5)
+# Tables are created on the primary only, real replicas get them by replication and are read-only.
+# Set for local replicas that are separate SQLite files
+DATABASE_REPLICA_CREATE_TABLES: bool = (os.getenv("DATABASE_REPLICA_CREATE_TABLES") or "false").lower() == "true"
+
+DATABASE_POOL_SIZE: int = int(os.getenv("DATABASE_POOL_SIZE") or 5)
+DATABASE_MAX_OVERFLOW: int = int(os.getenv("DATABASE_MAX_OVERFLOW") or 10)
+DATABASE_POOL_TIMEOUT: float = float(os.getenv("DATABASE_POOL_TIMEOUT") or 30)
+DATABASE_POOL_RECYCLE: int = int(os.getenv("DATABASE_POOL_RECYCLE") or 1800)
+DATABASE_POOL_PRE_PING: bool = (os.getenv("DATABASE_POOL_PRE_PING") or "true").lower() == "true"
+# Connections opened at startup so first requests don't pay for the handshake
+DATABASE_POOL_WARMUP: int = int(os.getenv("DATABASE_POOL_WARMUP") or 1)
+
 account_name: str = os.getenv("AzureWebJobsStorage__accountName") or ""
 if not account_name:
     raise Exception("No STORAGE_CONNECTION_STRING")
 STORAGE_ACCOUNT_URI = f"https://{account_name}.blob.core.windows.net"
+
+# Optional file, e.g. /dev/shm/azfunctions-blobs, through which workers of one host share loaded blobs
+BLOB_SHARED_SNAPSHOT_PATH: str = os.getenv("BLOB_SHARED_SNAPSHOT_PATH") or ""
+
+# Optional, e.g. "UseDevelopmentStorage=true" to run against Azurite instead of STORAGE_ACCOUNT_URI
+STORAGE_CONNECTION_STRING: str = os.getenv("STORAGE_CONNECTION_STRING") or ""
+
+# Rows written per statement by the bulk endpoints
+BULK_BATCH_SIZE: int = int(os.getenv("BULK_BATCH_SIZE") or 1000)
+
+# Same statement run more times than this in one request is reported as a possible N+1
+SQL_N_PLUS_ONE_THRESHOLD: int = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD") or 10)
+
+# Per-resolver tracing of GraphQL operations, operations slower than the threshold are logged
+GRAPHQL_TRACING: bool = (os.getenv("GRAPHQL_TRACING") or "true").lower() == "true"
+GRAPHQL_SLOW_OPERATION_MS: float = float(os.getenv("GRAPHQL_SLOW_OPERATION_MS") or 1000)
+GRAPHQL_SLOW_OPERATION_SAMPLE_RATE: float = float(os.getenv("GRAPHQL_SLOW_OPERATION_SAMPLE_RATE") or 1.0)
+
+# In-memory cache of read results, invalidated by writes made through this app and by the TTL
+RESULT_CACHE_ENABLED: bool = (os.getenv("RESULT_CACHE_ENABLED") or "true").lower() == "true"
+RESULT_CACHE_MAX_BYTES: int = int(os.getenv("RESULT_CACHE_MAX_BYTES") or 64 * 1024 * 1024)
+RESULT_CACHE_TTL_SECONDS: float = float(os.getenv("RESULT_CACHE_TTL_SECONDS") or 30)
+
+# Cache-Control sent with responses that carry an ETag, clients and CDNs revalidate with If-None-Match
+HTTP_CACHE_CONTROL: str = os.getenv("HTTP_CACHE_CONTROL") or "public, max-age=5, must-revalidate"
+
+# Optional summary tables kept up to date on writes, grouped GraphQL queries they cover are answered from them,
+# e.g. "Item(purchases.user_id)=count,sum(price);Purchase(item_id)=count". Build with python -m api.rollups rebuild
+AGGREGATE_ROLLUPS: str = os.getenv("AGGREGATE_ROLLUPS") or ""
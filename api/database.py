@@ -1,17 +1,213 @@
-from sqlmodel import create_engine, SQLModel, Session
-from typing import Generator
+from sqlmodel import SQLModel, Session, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
+from sqlalchemy.engine import make_url, URL, Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, PoolProxiedConnection
+from starlette.requests import Request
+from typing import AsyncGenerator
+import contextlib
+import itertools
+import asyncio
+import time
 
-from api.config.envs import DATABASE_CONNECTION_STRING
+from api.config.envs import (
+    DATABASE_CONNECTION_STRING, DATABASE_ASYNC_CONNECTION_STRING,
+    DATABASE_REPLICA_CONNECTION_STRINGS, DATABASE_REPLICA_SELECTION, DATABASE_REPLICA_CREATE_TABLES,
+    DATABASE_REPLICA_LAG_SECONDS,
+    DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW, DATABASE_POOL_TIMEOUT,
+    DATABASE_POOL_RECYCLE, DATABASE_POOL_PRE_PING, DATABASE_POOL_WARMUP
+)
 from api.models import User, Item, Purchase
+from api.sql_instrumentation import install_sql_instrumentation
+from api.result_cache import table_versions
+from api.rollups import rollups, rollup_metadata, check_rollups_built, RollupChanges
+from api.http_caching import ensure_table_versions, bump_table_versions
 
 
-engine = create_engine(DATABASE_CONNECTION_STRING)
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
 
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+def get_async_connection_url(connection_string: str) -> URL:
+    url = make_url(connection_string)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
 
 
-def get_session() -> Generator[Session, None, None]:
-    with Session(engine) as session:
+class MonitoredQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool recording how long checkouts wait for a connection,
+    including opening a new one when the pool is empty.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_count = 0
+        self.checkout_wait_seconds_total = 0.0
+        self.checkout_wait_seconds_max = 0.0
+
+    def connect(self) -> PoolProxiedConnection:
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            wait_seconds = time.perf_counter() - start
+            self.checkout_count += 1
+            self.checkout_wait_seconds_total += wait_seconds
+            self.checkout_wait_seconds_max = max(self.checkout_wait_seconds_max, wait_seconds)
+
+
+def is_memory_database(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def create_pooled_engine(connection_string: str | URL) -> AsyncEngine:
+    url = make_url(connection_string)
+    if is_memory_database(url):
+        # every pooled connection would open its own empty database, the default pool shares one
+        created_engine = create_async_engine(url)
+        install_sql_instrumentation(created_engine)
+        return created_engine
+
+    created_engine = create_async_engine(
+        url,
+        poolclass=MonitoredQueuePool,
+        pool_size=DATABASE_POOL_SIZE,
+        max_overflow=DATABASE_MAX_OVERFLOW,
+        pool_timeout=DATABASE_POOL_TIMEOUT,
+        pool_recycle=DATABASE_POOL_RECYCLE,
+        pool_pre_ping=DATABASE_POOL_PRE_PING
+    )
+    install_sql_instrumentation(created_engine)
+    return created_engine
+
+
+# primary, all writes go here
+engine = create_pooled_engine(DATABASE_ASYNC_CONNECTION_STRING or get_async_connection_url(DATABASE_CONNECTION_STRING))
+replica_engines = [
+    create_pooled_engine(get_async_connection_url(connection_string))
+    for connection_string in DATABASE_REPLICA_CONNECTION_STRINGS
+]
+all_engines = [engine, *replica_engines]
+
+
+class ReplicaSelector:
+    """
+    Picks the replica a session reads from, in turn or the one with the fewest
+    connections checked out (ties are broken in turn). Without replicas it's the primary.
+    """
+    def __init__(self, engines: list[AsyncEngine], strategy: str = DATABASE_REPLICA_SELECTION):
+        self.engines = engines
+        self.strategy = strategy
+        self._turn = itertools.count()
+
+    def select(self) -> AsyncEngine:
+        if not self.engines:
+            return engine
+        start = next(self._turn) % len(self.engines)
+        if self.strategy == "round_robin":
+            return self.engines[start]
+        in_turn = self.engines[start:] + self.engines[:start]
+        return min(in_turn, key=lambda candidate: candidate.pool.checkedout())     # type: ignore
+
+
+replica_selector = ReplicaSelector(replica_engines)
+
+
+class RoutingSession(Session):
+    """
+    Session reading from a replica and writing to the primary. Once a session writes,
+    or when info["primary"] is set up front, it uses only the primary, so reads
+    that follow a write in the same request see it. A session keeps the replica it started on.
+    Sessions starting within DATABASE_REPLICA_LAG_SECONDS of a write of this process use
+    the primary too, a lagging replica would return, and the result cache keep, older rows.
+    """
+    def get_bind(self, mapper=None, clause=None, **kwargs) -> Engine:
+        if self.info.get("primary") or self._flushing or getattr(clause, "is_dml", False):
+            self.info["primary"] = True
+            return engine.sync_engine
+        if "replica" not in self.info:
+            self.info["replica"] = replica_selector.select() \
+                if not table_versions.bumped_within(DATABASE_REPLICA_LAG_SECONDS) else engine
+        return self.info["replica"].sync_engine
+
+
+# objects stay loaded after commit, so responses can be serialized without lazy loads
+async_session = async_sessionmaker(class_=AsyncSession, sync_session_class=RoutingSession, expire_on_commit=False)
+
+
+@contextlib.asynccontextmanager
+async def transaction(db_session: AsyncSession, *models: type[SQLModel]) -> AsyncGenerator[RollupChanges, None]:
+    """
+    Commits db_session when the block succeeds and rolls it back otherwise. Every write path
+    goes through it with the models it writes: rollup groups collected in the block are
+    recomputed and the stored table versions bumped before the commit, cached results
+    read from the tables are invalidated after it.
+    """
+    rollup_changes = RollupChanges(db_session)
+    try:
+        yield rollup_changes
+        await rollup_changes.refresh()
+        await bump_table_versions(db_session, *models)
+    except Exception:
+        await db_session.rollback()
+        raise
+    await db_session.commit()
+    table_versions.bump(*models)
+
+
+async def create_db_and_tables():
+    # DDL on a replica would fail when it's read-only, or make it diverge from the primary
+    for created_engine in all_engines if DATABASE_REPLICA_CREATE_TABLES else [engine]:
+        async with created_engine.begin() as connection:
+            await connection.run_sync(SQLModel.metadata.create_all)
+            await connection.run_sync(rollup_metadata.create_all)
+
+    async with async_session() as db_session:
+        db_session.info["primary"] = True
+        await ensure_table_versions(db_session)
+
+    if rollups:
+        async with async_session() as db_session:
+            db_session.info["primary"] = True
+            await check_rollups_built(db_session)
+
+
+async def warm_up_pool(connections: int = DATABASE_POOL_WARMUP):
+    async def open_connection(pooled_engine: AsyncEngine):
+        async with pooled_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    # connections are opened concurrently and stay in the pool once released
+    await asyncio.gather(*(
+        open_connection(pooled_engine)
+        for pooled_engine in all_engines if isinstance(pooled_engine.pool, QueuePool)
+        for _ in range(min(connections, DATABASE_POOL_SIZE))
+    ))
+
+
+def get_pool_stats(pooled_engine: AsyncEngine = engine) -> dict[str, float]:
+    pool = pooled_engine.pool
+    if not isinstance(pool, QueuePool):
+        return {}
+    stats: dict[str, float] = {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # counts down from -pool_size while the pool is not full yet, only connections beyond it are overflow
+        "overflow": max(0, pool.overflow()),
+    }
+    if isinstance(pool, MonitoredQueuePool):
+        stats["checkout_count"] = pool.checkout_count
+        stats["checkout_wait_seconds_total"] = pool.checkout_wait_seconds_total
+        stats["checkout_wait_seconds_max"] = pool.checkout_wait_seconds_max
+    return stats
+
+
+async def get_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    async with async_session() as session:
+        # requests that may write use the primary throughout, GET requests read from a replica
+        session.info["primary"] = request.method not in ("GET", "HEAD")
         yield session
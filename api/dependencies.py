@@ -1,6 +1,11 @@
-from api.external_services.blob_storage_service import BlobService
-from fastapi import Request, Security, HTTPException
+from api.external_services.async_blob_storage_service import AsyncBlobService
+from dataclasses import dataclass
+from fastapi import Request, Security, HTTPException, Query
 from fastapi.security import APIKeyHeader
+from sqlalchemy.orm import noload
+from sqlalchemy.orm.interfaces import LoaderOption
+from sqlmodel import SQLModel
+from typing import Annotated, Callable
 import secrets
 
 from api.config.envs import INTERNAL_SECRET
@@ -11,5 +16,49 @@ def validate_internal_secret(api_key: str = Security(APIKeyHeader(name="X-Intern
         raise HTTPException(401)
 
 
-def get_blob_service(request: Request) -> BlobService:
+def get_blob_service(request: Request) -> AsyncBlobService:
     return request.app.state.blob_service
+
+
+@dataclass
+class LoadOptions:
+    options: list[LoaderOption]
+    # relationships that are not loaded, left out of responses instead of serialized as empty
+    excluded: set[str]
+
+
+class EagerLoad:
+    """
+    Dependency returning loader options for relationships of a model. Each endpoint
+    declares a loading strategy per relationship (selectinload, joinedload...), clients
+    can opt relationships in or out with ?expand=purchases or ?expand=-purchases.
+    Relationships left out are not loaded at all instead of being lazy loaded per row,
+    and are excluded from the response, an empty list would read as having none.
+    """
+    def __init__(self, model: type[SQLModel], strategies: dict[str, Callable[..., LoaderOption]],
+                 default: set[str] | None = None):
+        self.model = model
+        self.strategies = strategies
+        self.default = set(strategies) if default is None else default
+
+    def __call__(self, expand: Annotated[str | None, Query()] = None) -> LoadOptions:
+        expanded = set(self.default)
+        for name in (expand or "").split(","):
+            name = name.strip()
+            if not name:
+                continue
+            relationship_name = name.lstrip("-")
+            if relationship_name not in self.strategies:
+                raise HTTPException(status_code=400, detail=f"Can't expand '{relationship_name}'")
+            if name.startswith("-"):
+                expanded.discard(relationship_name)
+            else:
+                expanded.add(relationship_name)
+
+        return LoadOptions(
+            options=[
+                strategy(getattr(self.model, name)) if name in expanded else noload(getattr(self.model, name))
+                for name, strategy in self.strategies.items()
+            ],
+            excluded=set(self.strategies) - expanded
+        )
@@ -0,0 +1,109 @@
+from azure.storage.blob.aio import BlobServiceClient, ContainerClient, StorageStreamDownloader
+from azure.identity.aio import DefaultAzureCredential
+from azure.core.exceptions import ResourceNotFoundError, ResourceNotModifiedError, HttpResponseError
+from azure.core.pipeline.transport import AsyncHttpTransport
+from azure.core import MatchConditions
+import asyncio
+import weakref
+
+from api.config.envs import STORAGE_ACCOUNT_URI, CLIENT_ID, STORAGE_CONTAINER_NAME, STORAGE_CONNECTION_STRING
+
+
+_shared_blob_services: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncBlobService]' = \
+    weakref.WeakKeyDictionary()
+
+
+def create_async_blob_service() -> 'AsyncBlobService':
+    return AsyncBlobService(
+        STORAGE_ACCOUNT_URI, STORAGE_CONTAINER_NAME, CLIENT_ID,
+        connection_string=STORAGE_CONNECTION_STRING or None
+    )
+
+
+def get_shared_blob_service() -> 'AsyncBlobService':
+    """
+    Long-lived service of the running event loop, so the credential, its tokens
+    and the HTTP connection pool are reused instead of created on every call.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _shared_blob_services:
+        _shared_blob_services[loop] = create_async_blob_service()
+    return _shared_blob_services[loop]
+
+
+class AsyncBlobService:
+    def __init__(
+            self,
+            storage_account_uri: str,
+            container_name: str,
+            client_id: str | None = None,
+            connection_string: str | None = None,
+            transport: AsyncHttpTransport | None = None
+        ) -> None:
+        # connection_string allows running against Azurite, transport against a fake
+        client_kwargs = {"transport": transport} if transport else {}
+        self.credential: DefaultAzureCredential | None = None
+
+        if connection_string:
+            self.blob_service_client: BlobServiceClient = \
+                BlobServiceClient.from_connection_string(connection_string, **client_kwargs)
+        else:
+            if client_id:
+                self.credential = DefaultAzureCredential(managed_identity_client_id=client_id)
+            else:
+                self.credential = DefaultAzureCredential()
+            self.blob_service_client = \
+                BlobServiceClient(storage_account_uri, credential=self.credential, **client_kwargs)
+        self.container_client: ContainerClient = \
+            self.blob_service_client.get_container_client(container_name)
+
+    async def download_blob(self, blob_name: str) -> bytes:
+        blob_stream = await self.download_blob_stream(blob_name)
+        return await blob_stream.readall()
+
+    async def download_blobs(self, blob_names: list[str]) -> dict[str, bytes]:
+        contents = await asyncio.gather(*(self.download_blob(blob_name) for blob_name in blob_names))
+        return dict(zip(blob_names, contents))
+
+    async def download_blob_stream(
+            self,
+            blob_name: str,
+            offset: int | None = None,
+            length: int | None = None,
+            if_none_match: str | None = None
+        ) -> StorageStreamDownloader:
+        """
+        Starts a download without reading the content, which can be consumed with chunks().
+        Raises ResourceNotModifiedError when the blob still matches if_none_match ETag.
+        """
+        kwargs = {}
+        if if_none_match:
+            kwargs = {"etag": if_none_match, "match_condition": MatchConditions.IfModified}
+        try:
+            return await self.container_client.download_blob(blob_name, offset=offset, length=length, **kwargs)
+        except ResourceNotFoundError as e:
+            print("Non-existing blob file")
+            raise e
+        except HttpResponseError as e:
+            # storage reports a failed If-None-Match as a generic error with 304 status
+            if e.status_code == 304:
+                raise ResourceNotModifiedError(message="Blob not modified", response=e.response) from None
+            raise e
+
+    async def download_blob_if_modified(self, blob_name: str, etag: str | None) -> StorageStreamDownloader | None:
+        """
+        Conditional download, returns None when the blob still has the given ETag.
+        """
+        try:
+            return await self.download_blob_stream(blob_name, if_none_match=etag)
+        except ResourceNotModifiedError:
+            return None
+
+    async def get_blob_etag(self, blob_name: str) -> str:
+        properties = await self.container_client.get_blob_client(blob_name).get_blob_properties()
+        return properties.etag
+
+    async def close(self):
+        await self.blob_service_client.close()
+        if self.credential is not None:
+            await self.credential.close()
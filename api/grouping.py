@@ -0,0 +1,63 @@
+from sqlmodel import SQLModel, select, and_, or_, tuple_
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import FromClause
+import sqlalchemy
+
+
+def resolve_group_by(model: type[SQLModel], group_by: list[str]) -> tuple[list[ColumnElement], FromClause]:
+    """
+    Resolves grouped fields of model, plain ("age") or through relationships ("purchases.user_id"),
+    into their columns and the FROM clause joining every related model they come from.
+    """
+    joins_needed = []
+    joined_paths = set()
+
+    group_columns = []
+    for field_name in group_by:
+        field_name = field_name.lower()
+        if model.__name__.lower() in field_name:
+            raise Exception("You can't join the same model")
+        current_model = model
+        path_prefix = ""
+
+        field_parts = field_name.split(".")
+        for field_part in field_parts[:-1]:
+            mapper = sqlalchemy.inspect(current_model)
+            if mapper is None or field_part not in mapper.relationships:
+                raise Exception(f"Relationship '{field_part}' not found in model {current_model.__name__}")
+
+            relationship_attr = mapper.relationships[field_part]
+            target_model = relationship_attr.mapper.class_
+            path_key = f"{path_prefix}.{field_part}"
+
+            if path_key not in joined_paths:
+                joins_needed.append(target_model)
+                joined_paths.add(path_key)
+
+            current_model = target_model
+            path_prefix = path_key
+
+        if not hasattr(current_model, field_parts[-1]):
+            raise Exception(f"Field {field_name} not found in model")
+        group_columns.append(getattr(current_model, field_parts[-1]))
+
+    query = select(model)
+    for join_model in joins_needed:
+        query = query.join(join_model)
+    return group_columns, query.get_final_froms()[0]
+
+
+def group_keys_condition(group_columns: list[ColumnElement], group_keys: list[tuple]) -> ColumnElement:
+    # NULL never matches IN, so keys containing NULL are compared one by one
+    not_null_keys = [key for key in group_keys if None not in key]
+    null_keys = [key for key in group_keys if None in key]
+
+    conditions = []
+    if not_null_keys:
+        if len(group_columns) == 1:
+            conditions.append(group_columns[0].in_([key[0] for key in not_null_keys]))
+        else:
+            conditions.append(tuple_(*group_columns).in_(not_null_keys))
+    for key in null_keys:
+        conditions.append(and_(*[column == value for column, value in zip(group_columns, key)]))
+    return or_(*conditions)
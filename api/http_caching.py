@@ -0,0 +1,93 @@
+from hashlib import blake2b
+from sqlmodel import SQLModel, select, update, insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import Table, Column, String, BigInteger
+from sqlalchemy.exc import IntegrityError
+from starlette.responses import Response
+from typing import Any, Iterable
+
+from api.config.BlobHolderService import BlobSnapshot
+from api.config.envs import HTTP_CACHE_CONTROL
+
+
+# change counters of tables kept in the database, so every instance derives the same
+# ETags and they survive restarts, unlike the per-process table_versions
+table_version = Table(
+    "table_version",
+    SQLModel.metadata,
+    Column("name", String(64), primary_key=True),
+    Column("version", BigInteger, nullable=False)
+)
+
+
+def make_etag(*parts: Any) -> str:
+    return '"' + blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest() + '"'
+
+
+async def ensure_table_versions(db_session: AsyncSession):
+    """
+    Adds the missing counter rows on startup, so bumps only have to update them.
+    """
+    names = {table.name for table in SQLModel.metadata.sorted_tables if table is not table_version}
+    existing = set((await db_session.exec(select(table_version.c.name))).all())     # type: ignore
+    missing = names - existing
+    if not missing:
+        return
+    try:
+        await db_session.exec(insert(table_version), params=[      # type: ignore
+            {"name": name, "version": 0} for name in sorted(missing)
+        ])
+        await db_session.commit()
+    except IntegrityError:
+        # another instance starting at the same time added them
+        await db_session.rollback()
+
+
+async def bump_table_versions(db_session: AsyncSession, *tables: type[SQLModel] | str):
+    """
+    Bumps the counters in the transaction of the write, so they change exactly when it commits.
+    Writes made outside of this app don't bump them, the ETags of their tables then stay the same.
+    """
+    for table in tables:
+        name = table if isinstance(table, str) else table.__tablename__    # type: ignore
+        result = await db_session.exec(      # type: ignore
+            update(table_version).where(table_version.c.name == name).values(version=table_version.c.version + 1)
+        )
+        if not result.rowcount:
+            await db_session.exec(insert(table_version).values(name=name, version=1))     # type: ignore
+
+
+async def table_etag(db_session: AsyncSession, tables: Iterable[str]) -> str:
+    """
+    Strong ETag of a representation read from tables, one primary key lookup instead of reading them.
+    """
+    tables = sorted(tables)
+    rows = (await db_session.exec(      # type: ignore
+        select(table_version.c.name, table_version.c.version).where(table_version.c.name.in_(tables))
+    )).all()
+    versions = dict(rows)
+    return make_etag([(table, versions.get(table, 0)) for table in tables])
+
+
+def blob_etag(snapshot: BlobSnapshot) -> str:
+    # the storage ETag, or the content itself, is the same in every process
+    if snapshot.etag:
+        return make_etag(snapshot.name, snapshot.etag)
+    return make_etag(snapshot.name, snapshot.content)
+
+
+def validator_headers(etag: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": HTTP_CACHE_CONTROL}
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, W/"x" matches "x"
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag))
@@ -1,44 +1,97 @@
 import uvicorn
+import asyncio
+import time
 from fastapi import FastAPI, Request
-from strawberry.fastapi import GraphQLRouter
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
-from api.routers.REST import file_contents_router, users_router
+from api.routers.REST import file_contents_router, users_router, metrics_router
 from api.routers.GraphQL import graphql_router
-from api.external_services.blob_storage_service import create_blob_service
-from api.database import create_db_and_tables
+from api.external_services.async_blob_storage_service import AsyncBlobService, get_shared_blob_service
+from api.database import create_db_and_tables, warm_up_pool, all_engines
 from api.config.envs import CONFIG_BLOB_NAME, QUERY_BLOB_NAME
 from api.config.BlobHolderService import BlobHolderService
+from api.startup_timing import startup_timer
+from api.sql_instrumentation import start_request_stats, finish_request_stats, set_server_timing
 
 
 blob_holder_service = BlobHolderService()
 
+async def load_blobs(blob_service: AsyncBlobService):
+    async def load_blob(blob_name: str):
+        # with a shared store another worker may have loaded the blob already,
+        # it is downloaded again only when it changed since
+        snapshot = blob_holder_service.get_snapshot(blob_name)
+        blob_stream = await blob_service.download_blob_if_modified(blob_name, snapshot.etag if snapshot else None)
+        if blob_stream is None:
+            return
+        blob_holder_service.update_blob_content(
+            blob_name,
+            (await blob_stream.readall()).decode("utf-8"),
+            etag=blob_stream.properties.etag,
+            last_modified=blob_stream.properties.last_modified
+        )
+
+    await asyncio.gather(*(load_blob(blob_name) for blob_name in (CONFIG_BLOB_NAME, QUERY_BLOB_NAME)))
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
-    blob_service = create_blob_service()
+    blob_service = get_shared_blob_service()
     app.state.blob_service = blob_service
 
-    config_file_data = blob_service.download_blob(CONFIG_BLOB_NAME).decode("utf-8")
-    custom_query = blob_service.download_blob(QUERY_BLOB_NAME).decode("utf-8")
-    blob_holder_service.update_blob_content(CONFIG_BLOB_NAME, config_file_data)
-    blob_holder_service.update_blob_content(QUERY_BLOB_NAME, custom_query)
-
-    create_db_and_tables()
+    # blobs and database are independent, so they are prepared concurrently
+    with startup_timer.phase("lifespan"):
+        await asyncio.gather(
+            startup_timer.measure("blob loads", load_blobs(blob_service)),
+            startup_timer.measure("create_db_and_tables", create_db_and_tables()),
+            startup_timer.measure("pool warm-up", warm_up_pool())
+        )
+    startup_timer.report()
     yield
-    blob_service.close()
+    await blob_service.close()
+    # pooled connections are closed instead of dropped, aiosqlite threads would keep the process alive
+    await asyncio.gather(*(pooled_engine.dispose() for pooled_engine in all_engines))
 
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(file_contents_router.router)
 app.include_router(users_router.router)
+app.include_router(metrics_router.router)
 app.include_router(
-    GraphQLRouter(graphql_router.schema, context_getter=graphql_router.get_context),
+    graphql_router.LazySchemaGraphQLRouter(graphql_router.get_schema, context_getter=graphql_router.get_context),
     prefix="/graphql"
 )
 
 
+@app.middleware("http")
+async def instrument_sql(request: Request, call_next):
+    stats = start_request_stats()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        # failed requests ran their queries too, and are often the slow ones
+        finish_request_stats(request, stats, time.perf_counter() - start)
+        raise
+    set_server_timing(response, stats, time.perf_counter() - start)
+
+    # streamed bodies keep running queries after call_next returns,
+    # so the request is recorded once its body was sent
+    body_iterator = response.body_iterator
+
+    async def recorded_body_iterator():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            finish_request_stats(request, stats, time.perf_counter() - start)
+
+    response.body_iterator = recorded_body_iterator()
+    return response
+
+
 @app.exception_handler(Exception)
 async def validation_exception_handler(request: Request, exc: Exception):
     print(f"Error: {exc}")
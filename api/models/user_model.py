@@ -21,3 +21,7 @@ class UserPublic(UserBase):
 class UserUpdate(UserBase):
     name: str | None = None # type: ignore
     age: int | None = None
+
+
+class UserBulkUpdate(UserUpdate):
+    id: int
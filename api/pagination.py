@@ -0,0 +1,110 @@
+from sqlmodel import SQLModel, and_, or_
+from sqlalchemy.sql.selectable import Select
+from sqlalchemy.sql.elements import ColumnElement
+from datetime import datetime
+from decimal import Decimal
+import sqlalchemy
+import base64
+import json
+import typing
+
+
+# (field name, descending)
+OrderKey = typing.Tuple[str, bool]
+
+
+def keyset_order(model: typing.Type[SQLModel], order_by: typing.List[OrderKey]) -> typing.List[OrderKey]:
+    """
+    Returns order_by extended with the primary key, so every row has a unique position.
+    """
+    order = list(order_by)
+    ordered_fields = {field for field, _ in order}
+    for column in sqlalchemy.inspect(model).primary_key:
+        if column.name not in ordered_fields:
+            order.append((column.name, False))
+    return order
+
+
+def _encode_value(value: typing.Any) -> typing.Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    # MySQL returns SUM and AVG as Decimal, kept as a string to not lose precision
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    return value
+
+
+def _decode_value(value: typing.Any) -> typing.Any:
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    if isinstance(value, dict) and "dec" in value:
+        return Decimal(value["dec"])
+    return value
+
+
+def encode_cursor(order: typing.List[OrderKey], row: typing.Any) -> str:
+    payload = {
+        "f": [field for field, _ in order],
+        "v": [_encode_value(getattr(row, field)) for field, _ in order]
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(order: typing.List[OrderKey], cursor: str) -> typing.List[typing.Any]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        fields, values = payload["f"], payload["v"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if fields != [field for field, _ in order] or len(values) != len(fields):
+        raise ValueError("Cursor does not match requested ordering")
+    return [_decode_value(value) for value in values]
+
+
+def _after_condition(column: ColumnElement, descending: bool, value: typing.Any) -> ColumnElement:
+    # NULLs sort first in ascending order (MySQL and SQLite semantics)
+    if descending:
+        if value is None:
+            return sqlalchemy.false()
+        return or_(column < value, column.is_(None))
+    if value is None:
+        return column.is_not(None)
+    return column > value
+
+
+def _equal_condition(column: ColumnElement, value: typing.Any) -> ColumnElement:
+    return column.is_(None) if value is None else column == value
+
+
+def keyset_condition(
+        columns: typing.List[ColumnElement],
+        order: typing.List[OrderKey],
+        values: typing.List[typing.Any]
+    ) -> ColumnElement:
+    """
+    Condition matching rows positioned after values in the ordering of columns.
+    """
+    conditions = []
+    for i, (column, (_, descending)) in enumerate(zip(columns, order)):
+        equal_prefix = [_equal_condition(columns[j], values[j]) for j in range(i)]
+        conditions.append(and_(*equal_prefix, _after_condition(column, descending, values[i])))
+    return or_(*conditions)
+
+
+def apply_keyset(
+        query: Select,
+        model: typing.Type[SQLModel],
+        order: typing.List[OrderKey],
+        cursor: typing.Optional[str] = None
+    ) -> Select:
+    """
+    Orders query by the keyset and, when cursor is given, seeks past the row it points at
+    instead of skipping rows with OFFSET.
+    """
+    columns = [getattr(model, field) for field, _ in order]
+    for column, (_, descending) in zip(columns, order):
+        query = query.order_by(column.desc() if descending else column)
+
+    if cursor is None:
+        return query
+    return query.where(keyset_condition(columns, order, decode_cursor(order, cursor)))
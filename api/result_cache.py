@@ -0,0 +1,104 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from sqlmodel import SQLModel
+from typing import Any, Hashable, Iterable
+import threading
+import time
+
+from api.config.envs import RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL_SECONDS
+
+
+class TableVersions:
+    """
+    Change counters per table. Writers bump tables after committing, cached results
+    remember versions of the tables they were read from and are dropped once one changes.
+    Counters are per process, writes made elsewhere are only caught up with by the cache TTL.
+    """
+    def __init__(self):
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._last_bump: float | None = None
+
+    def bump(self, *tables: type[SQLModel] | str):
+        with self._lock:
+            for table in tables:
+                name = table if isinstance(table, str) else table.__tablename__    # type: ignore
+                self._versions[name] = self._versions.get(name, 0) + 1
+            self._last_bump = time.monotonic()
+
+    def bumped_within(self, seconds: float) -> bool:
+        last_bump = self._last_bump
+        return last_bump is not None and time.monotonic() - last_bump < seconds
+
+    def get(self, table: str) -> int:
+        return self._versions.get(table, 0)
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._versions)
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    size: int
+    expires_at: float
+    versions: dict[str, int]
+
+
+class ResultCache:
+    """
+    LRU cache bounded by the total size of its values, with a TTL per entry.
+    """
+    def __init__(self, versions: TableVersions, max_bytes: int = RESULT_CACHE_MAX_BYTES,
+                 ttl_seconds: float = RESULT_CACHE_TTL_SECONDS):
+        self.versions = versions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size = 0
+        self.stats = dict.fromkeys(("hits", "misses", "evictions", "invalidations"), 0)
+        self._entries: OrderedDict[Hashable, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if entry.expires_at < time.monotonic() or any(
+                self.versions.get(table) != version for table, version in entry.versions.items()
+            ):
+                self._remove(key)
+                self.stats["invalidations"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry.value
+
+    def put(self, key: Hashable, value: Any, size: int, tables: Iterable[str], versions: dict[str, int]):
+        """
+        Stores value read from tables. versions has to be taken before reading,
+        so a write committed while reading invalidates the entry right away.
+        """
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CacheEntry(
+                value, size, time.monotonic() + self.ttl_seconds,
+                {table: versions.get(table, 0) for table in tables}
+            )
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def _remove(self, key: Hashable):
+        self.size -= self._entries.pop(key).size
+
+
+table_versions = TableVersions()
+result_cache = ResultCache(table_versions)
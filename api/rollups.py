@@ -0,0 +1,263 @@
+"""
+Incrementally maintained aggregates of grouped queries, configured with AGGREGATE_ROLLUPS.
+
+    python -m api.rollups rebuild
+
+builds new rollups and recomputes every rollup from scratch, e.g. after rows were changed
+outside of this app. Rollups are used by queries only once they were built.
+"""
+from datetime import datetime, timezone
+from hashlib import blake2b
+from sqlmodel import SQLModel, insert, delete, func, literal
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import MetaData, Table, Column, String, BigInteger, Float, DateTime, cast, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.util import find_tables
+from typing import Any, Iterable
+import argparse
+import asyncio
+import logging
+import json
+import re
+
+import api.models as models
+from api.bulk import get_primary_key, batched
+from api.grouping import resolve_group_by, group_keys_condition
+from api.config.envs import AGGREGATE_ROLLUPS, BULK_BATCH_SIZE
+
+
+ROLLUP_PATTERN = re.compile(r"^(\w+)\(([^)]+)\)=(.+)$")
+SUM_PATTERN = re.compile(r"^sum\((\w+)\)$")
+
+# kept apart from SQLModel.metadata, rollup tables are created only when configured
+rollup_metadata = MetaData()
+
+# rollups whose table holds every group, written by the rebuild in its transaction
+rollup_state = Table(
+    "rollup_state",
+    rollup_metadata,
+    Column("name", String(128), primary_key=True),
+    Column("built_at", DateTime, nullable=False)
+)
+
+
+def group_key_hash(key: tuple) -> str:
+    return blake2b(json.dumps(key, default=str).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class Rollup:
+    """
+    Table holding the row count, and sum and count of non-NULL values of sum_fields,
+    of every group of model grouped by group_by, as a grouped query computes them.
+    Rows are keyed by a hash of the group key, group keys may contain NULL.
+    """
+    def __init__(self, model: type[SQLModel], group_by: list[str], sum_fields: list[str]):
+        self.model = model
+        self.group_by = [field.lower() for field in group_by]
+        self.sum_fields = sum_fields
+        self.group_columns, self.from_clause = resolve_group_by(model, self.group_by)
+        self.source_tables = {table.name for table in find_tables(self.from_clause) if isinstance(table, Table)}
+        # known to be built, set from rollup_state, which is checked again until it is
+        self.built = False
+
+        sum_columns = []
+        for field in sum_fields:
+            column = getattr(model, field, None)
+            python_type = column.type.python_type if column is not None else None
+            if python_type not in (int, float):
+                raise Exception(f"sum needs a numeric field of {model.__name__}, got '{field}'")
+            sum_columns += [
+                Column(f"sum_{field}", Float if python_type is float else BigInteger),
+                Column(f"count_{field}", BigInteger, nullable=False)
+            ]
+
+        # a changed definition gets a new table, which is built on startup
+        definition = f"{model.__name__}({','.join(self.group_by)})={','.join(sum_fields)}"
+        self.table = Table(
+            f"rollup_{model.__tablename__}_{blake2b(definition.encode('utf-8'), digest_size=4).hexdigest()}",
+            rollup_metadata,
+            Column("key_hash", String(32), primary_key=True),
+            *[Column(f"group_{i}", column.type, index=True) for i, column in enumerate(self.group_columns)],
+            Column("count", BigInteger, nullable=False),
+            *sum_columns
+        )
+
+    def covers(self, group_by: list[str], aggregates: Iterable[tuple[str, str | None]]) -> bool:
+        if sorted(field.lower() for field in group_by) != sorted(self.group_by):
+            return False
+        return all(
+            op_name == "count" or (op_name in ("sum", "avg") and field_name in self.sum_fields)
+            for op_name, field_name in aggregates
+        )
+
+    def key_columns(self, group_by: list[str]) -> list[Column]:
+        return [self.table.c[f"group_{self.group_by.index(field.lower())}"] for field in group_by]
+
+    def aggregate_expression(self, key: tuple[str, str | None]) -> ColumnElement:
+        op_name, field_name = key
+        if op_name == "count":
+            return self.table.c["count"]
+        if op_name == "sum":
+            return self.table.c[f"sum_{field_name}"]
+        # AVG skips NULLs, so it's divided by the count of non-NULL values
+        return cast(self.table.c[f"sum_{field_name}"], Float) / func.nullif(self.table.c[f"count_{field_name}"], 0)
+
+    def _grouped_select(self):
+        aggregates: list[Any] = [func.count().label("count")]
+        for field in self.sum_fields:
+            column = getattr(self.model, field)
+            aggregates += [func.sum(column).label(f"sum_{field}"), func.count(column).label(f"count_{field}")]
+        return (
+            select(*[column.label(f"group_{i}") for i, column in enumerate(self.group_columns)], *aggregates)
+            .select_from(self.from_clause)
+            .group_by(*self.group_columns)
+        )
+
+    async def _insert(self, db_session: AsyncSession, rows: list):
+        if rows:
+            await db_session.exec(insert(self.table), params=[      # type: ignore
+                {"key_hash": group_key_hash(tuple(row[:len(self.group_columns)])), **row._mapping}
+                for row in rows
+            ])
+
+    async def group_keys_of(self, db_session: AsyncSession, model: type[SQLModel], ids: list[Any]) -> set[tuple]:
+        """
+        Keys of the groups rows of model with ids currently belong to.
+        """
+        primary_key = get_primary_key(model)
+        keys: set[tuple] = set()
+        for batch in batched(ids, BULK_BATCH_SIZE):
+            query = select(*self.group_columns).select_from(self.from_clause).where(primary_key.in_(batch)).distinct()
+            keys.update(tuple(row) for row in (await db_session.exec(query)).all())
+        return keys
+
+    async def refresh_groups(self, db_session: AsyncSession, keys: Iterable[tuple]):
+        """
+        Recomputes the given groups from their rows only. Groups left without rows are removed.
+        """
+        for batch in batched(keys, BULK_BATCH_SIZE):
+            await db_session.exec(delete(self.table).where(      # type: ignore
+                self.table.c.key_hash.in_([group_key_hash(key) for key in batch])
+            ))
+            query = self._grouped_select().where(group_keys_condition(self.group_columns, batch))
+            await self._insert(db_session, list((await db_session.exec(query)).all()))
+
+    def built_query(self):
+        return select(rollup_state.c.name).where(rollup_state.c.name == self.table.name)
+
+    async def mark_built(self, db_session: AsyncSession):
+        await db_session.exec(delete(rollup_state).where(rollup_state.c.name == self.table.name))     # type: ignore
+        await db_session.exec(insert(rollup_state).values(      # type: ignore
+            name=self.table.name, built_at=datetime.now(timezone.utc)
+        ))
+
+    async def rebuild(self, db_session: AsyncSession):
+        await db_session.exec(delete(self.table))     # type: ignore
+        rows = (await db_session.exec(self._grouped_select())).all()
+        for batch in batched(rows, BULK_BATCH_SIZE):
+            await self._insert(db_session, batch)
+        await self.mark_built(db_session)
+
+
+def parse_rollups(definitions: str) -> list[Rollup]:
+    parsed = []
+    for definition in definitions.replace(" ", "").split(";"):
+        if not definition:
+            continue
+        match = ROLLUP_PATTERN.match(definition)
+        if not match:
+            raise Exception(f"Invalid rollup '{definition}', expected e.g. Item(purchases.user_id)=count,sum(price)")
+        model = getattr(models, match.group(1), None)
+        if not (isinstance(model, type) and issubclass(model, SQLModel)):
+            raise Exception(f"Unknown model '{match.group(1)}' in rollup '{definition}'")
+
+        sum_fields = []
+        for aggregate in match.group(3).split(","):
+            if aggregate == "count":
+                continue
+            sum_match = SUM_PATTERN.match(aggregate)
+            if not sum_match:
+                # MIN and MAX can't be updated when rows are deleted without reading the whole group
+                raise Exception(f"Rollups maintain count and sum(field), got '{aggregate}'")
+            sum_fields.append(sum_match.group(1))
+        parsed.append(Rollup(model, match.group(2).split(","), sum_fields))
+    return parsed
+
+
+rollups = parse_rollups(AGGREGATE_ROLLUPS)
+
+
+def find_rollup(model: type[SQLModel], group_by: list[str],
+                aggregates: Iterable[tuple[str, str | None]]) -> Rollup | None:
+    aggregates = list(aggregates)
+    return next((rollup for rollup in rollups if rollup.model is model and rollup.covers(group_by, aggregates)), None)
+
+
+def rollups_reading(model: type[SQLModel]) -> list[Rollup]:
+    return [rollup for rollup in rollups if model.__tablename__ in rollup.source_tables]     # type: ignore
+
+
+class RollupChanges:
+    """
+    Groups of rollups touched by the writes of one transaction. Rows are collected before
+    they are updated or deleted and after they are inserted or updated, refresh() then
+    recomputes the touched groups in the same transaction. Does nothing without rollups.
+    """
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+        self.groups: dict[Rollup, set[tuple]] = {}
+
+    async def collect(self, model: type[SQLModel], ids: list[Any]):
+        for rollup in rollups_reading(model):
+            keys = await rollup.group_keys_of(self.db_session, model, ids)
+            self.groups.setdefault(rollup, set()).update(keys)
+
+    async def refresh(self):
+        for rollup, keys in self.groups.items():
+            await rollup.refresh_groups(self.db_session, keys)
+        self.groups = {}
+
+
+async def check_rollups_built(db_session: AsyncSession):
+    """
+    Loads which rollups are built. Building reads every grouped row, so it is left to
+    python -m api.rollups rebuild instead of slowing down and racing in every starting instance.
+    Only rollups of empty tables are marked built here, writes maintain them from then on.
+    """
+    built = set((await db_session.exec(select(rollup_state.c.name))).all())     # type: ignore
+    for rollup in rollups:
+        if rollup.table.name in built:
+            rollup.built = True
+            continue
+        if (await db_session.exec(select(literal(1)).select_from(rollup.from_clause).limit(1))).first() is None:
+            try:
+                await rollup.mark_built(db_session)
+                await db_session.commit()
+            except IntegrityError:
+                # another instance starting at the same time marked it
+                await db_session.rollback()
+            rollup.built = True
+            continue
+        logging.warning(f"Rollup {rollup.table.name} is not built and not used by queries, "
+                        f"run python -m api.rollups rebuild")
+
+
+async def rebuild_all():
+    from api.database import async_session, create_db_and_tables, engine
+
+    await create_db_and_tables()
+    async with async_session() as db_session:
+        db_session.info["primary"] = True
+        for rollup in rollups:
+            await rollup.rebuild(db_session)
+            print(f"Rebuilt {rollup.table.name}")
+        await db_session.commit()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintenance of the AGGREGATE_ROLLUPS tables")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+    asyncio.run(rebuild_all())
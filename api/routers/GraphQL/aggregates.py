@@ -0,0 +1,105 @@
+from sqlmodel import SQLModel, func, col
+from sqlalchemy.sql.elements import ColumnElement, Label
+from enum import Enum
+from strawberry.utils.str_converters import to_camel_case
+import strawberry
+import typing
+
+from api.routers.GraphQL.metaclasses import AGGREGATE_OPERATIONS, get_numeric_fields
+from api.routers.GraphQL.selection import flatten_selections, find_selections
+
+
+AggregateKey = typing.Tuple[str, typing.Optional[str]]
+# builds the expression of an aggregate, over the grouped rows or over a rollup table
+AggregateExpressionFunc = typing.Callable[[AggregateKey], ColumnElement]
+
+
+@strawberry.enum
+class AggregateOperation(Enum):
+    count = "count"
+    sum = "sum"
+    max = "max"
+    min = "min"
+    avg = "avg"
+
+
+@strawberry.input
+class AggregateRef:
+    operation: AggregateOperation
+    field: typing.Optional[str] = None
+
+
+@strawberry.input
+class HavingFilter:
+    aggregate: AggregateRef
+    eq: typing.Optional[float] = None
+    ne: typing.Optional[float] = None
+    gt: typing.Optional[float] = None
+    gte: typing.Optional[float] = None
+    lt: typing.Optional[float] = None
+    lte: typing.Optional[float] = None
+
+
+HAVING_OPERATORS = {
+    "eq": lambda column, value: column == value,
+    "ne": lambda column, value: column != value,
+    "gt": lambda column, value: column > value,
+    "gte": lambda column, value: column >= value,
+    "lt": lambda column, value: column < value,
+    "lte": lambda column, value: column <= value
+}
+
+
+def plan_aggregates(info: strawberry.Info, model: typing.Type[SQLModel]) -> typing.List[AggregateKey]:
+    """
+    Collects every aggregate requested under `aggregate` of a grouped query,
+    including aliased and fragment selections, as (operation, field name) pairs.
+    """
+    graphql_names = {to_camel_case(field): field for field in get_numeric_fields(model)}
+    planned: typing.Dict[AggregateKey, None] = {}
+
+    for aggregate_field in find_selections(info.selected_fields, ["aggregate"]):
+        for op_field in flatten_selections(aggregate_field.selections):
+            if op_field.name == "count":
+                planned[("count", None)] = None
+            elif op_field.name in AGGREGATE_OPERATIONS:
+                for value_field in flatten_selections(op_field.selections):
+                    if value_field.name in graphql_names:
+                        planned[(op_field.name, graphql_names[value_field.name])] = None
+    return list(planned)
+
+
+def get_aggregate_key(ref: AggregateRef, model: typing.Type[SQLModel]) -> AggregateKey:
+    if ref.operation == AggregateOperation.count:
+        return ("count", None)
+    numeric_fields = get_numeric_fields(model)
+    field_name = {to_camel_case(field): field for field in numeric_fields}.get(ref.field or "", ref.field)
+    if field_name not in numeric_fields:
+        raise Exception(f"{ref.operation.value} needs a numeric field of {model.__name__}, got '{ref.field}'")
+    return (ref.operation.value, field_name)
+
+
+def aggregate_expression(key: AggregateKey, model: typing.Type[SQLModel]) -> ColumnElement:
+    op_name, field_name = key
+    if op_name == "count":
+        return func.count()
+    return AGGREGATE_OPERATIONS[op_name](col(getattr(model, field_name)))
+
+
+def aggregate_columns(plan: typing.List[AggregateKey], model: typing.Type[SQLModel],
+                      expression_func: typing.Optional[AggregateExpressionFunc] = None) -> typing.List[Label]:
+    expression_func = expression_func or (lambda key: aggregate_expression(key, model))
+    return [expression_func(key).label(f"agg_{i}") for i, key in enumerate(plan)]
+
+
+def having_conditions(having: typing.List[HavingFilter], model: typing.Type[SQLModel],
+                      expression_func: typing.Optional[AggregateExpressionFunc] = None) -> typing.List[ColumnElement]:
+    expression_func = expression_func or (lambda key: aggregate_expression(key, model))
+    conditions = []
+    for having_filter in having:
+        expression = expression_func(get_aggregate_key(having_filter.aggregate, model))
+        for operator, compare in HAVING_OPERATORS.items():
+            value = getattr(having_filter, operator)
+            if value is not None:
+                conditions.append(compare(expression, value))
+    return conditions
@@ -0,0 +1,200 @@
+from strawberry.extensions import SchemaExtension
+from strawberry.types.graphql import OperationType
+from graphql import ExecutionResult, GraphQLResolveInfo, get_named_type, is_leaf_type
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+import inspect
+import logging
+import random
+import typing
+import json
+import time
+import re
+
+from api.sql_instrumentation import current_sql_stats, current_sql_trace, current_read_tables, statement_shape
+from api.result_cache import result_cache, table_versions
+from api.config.envs import GRAPHQL_SLOW_OPERATION_MS, GRAPHQL_SLOW_OPERATION_SAMPLE_RATE
+
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+STRING_LITERAL_PATTERN = re.compile(r'"""[\s\S]*?"""|"(?:[^"\\]|\\.)*"')
+SLOWEST_RESOLVERS_LOGGED = 10
+
+
+class OperationNameExtension(SchemaExtension):
+    """
+    Labels SQL statistics of the request with the GraphQL operation name.
+    """
+    def on_execute(self):
+        stats = current_sql_stats.get()
+        if stats is not None:
+            stats.operation_name = self.execution_context.operation_name or "anonymous"
+        yield
+
+
+class DatabaseRoutingExtension(SchemaExtension):
+    """
+    Sends mutations, and whatever they read, to the primary database. Queries read from a replica.
+    """
+    def on_execute(self):
+        if self.execution_context.operation_type == OperationType.MUTATION:
+            self.execution_context.context["db_session"].info["primary"] = True
+        yield
+
+
+class ResultCacheExtension(SchemaExtension):
+    """
+    Serves repeated queries from result_cache. Entries are keyed by the normalized
+    query (which holds the selection set), operation name and variables, and are
+    invalidated by version bumps of the tables read while executing them.
+    """
+    def on_execute(self):
+        execution_context = self.execution_context
+        if execution_context.operation_type != OperationType.QUERY:
+            yield
+            return
+
+        key = (
+            "graphql",
+            WHITESPACE_PATTERN.sub(" ", execution_context.query or "").strip(),
+            execution_context.operation_name,
+            json.dumps(execution_context.variables or {}, sort_keys=True, default=str)
+        )
+        cached = result_cache.get(key)
+        if cached is not None:
+            # a result set before execution makes strawberry skip it
+            execution_context.result = ExecutionResult(data=cached)
+            yield
+            return
+
+        versions = table_versions.snapshot()
+        read_tables: typing.Set[str] = set()
+        token = current_read_tables.set(read_tables)
+        try:
+            yield
+        finally:
+            current_read_tables.reset(token)
+
+        result = execution_context.result
+        if isinstance(result, ExecutionResult) and not result.errors and result.data and "*" not in read_tables:
+            size = len(json.dumps(result.data, default=str))
+            result_cache.put(key, result.data, size, read_tables, versions)
+
+
+@dataclass
+class FieldTiming:
+    calls: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    sql_statements: int = 0
+    sql_seconds: float = 0.0
+
+
+def redact(value: typing.Any) -> typing.Any:
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return None if value is None else "[redacted]"
+
+
+class TracingExtension(SchemaExtension):
+    """
+    Times parse/validate/execute phases and every resolver of non-leaf fields,
+    together with the SQL each resolver runs. Operations slower than GRAPHQL_SLOW_OPERATION_MS
+    are logged (sampled by GRAPHQL_SLOW_OPERATION_SAMPLE_RATE) with variables and string literals redacted.
+    Leaf fields are skipped, they only read values already loaded by their parents.
+    """
+    def on_operation(self):
+        self.phases: typing.Dict[str, float] = {}
+        self.fields: typing.Dict[str, FieldTiming] = {}
+        self.resolver_calls: typing.List[typing.Tuple[float, str, typing.List[typing.Tuple[str, float]]]] = []
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        if seconds * 1000 >= GRAPHQL_SLOW_OPERATION_MS and random.random() < GRAPHQL_SLOW_OPERATION_SAMPLE_RATE:
+            logging.warning(f"Slow GraphQL operation: {json.dumps(self.get_trace(seconds), default=str)}")
+
+    def on_parse(self):
+        with self.phase("parse"):
+            yield
+
+    def on_validate(self):
+        with self.phase("validate"):
+            yield
+
+    def on_execute(self):
+        with self.phase("execute"):
+            yield
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def resolve(self, _next, root, info: GraphQLResolveInfo, *args, **kwargs):
+        if is_leaf_type(get_named_type(info.return_type)):
+            return _next(root, info, *args, **kwargs)
+
+        sql_trace: typing.List[typing.Tuple[str, float]] = []
+        start = time.perf_counter()
+        token = current_sql_trace.set(sql_trace)
+        try:
+            result = _next(root, info, *args, **kwargs)
+        except Exception:
+            self.record(info, start, sql_trace)
+            raise
+        finally:
+            current_sql_trace.reset(token)
+
+        if inspect.isawaitable(result):
+            return self.await_traced(result, info, start, sql_trace)
+        self.record(info, start, sql_trace)
+        return result
+
+    async def await_traced(self, result: typing.Awaitable, info: GraphQLResolveInfo,
+                           start: float, sql_trace: typing.List[typing.Tuple[str, float]]):
+        # statements of a DataLoader batch are attributed to the resolver that started it
+        token = current_sql_trace.set(sql_trace)
+        try:
+            return await result
+        finally:
+            current_sql_trace.reset(token)
+            self.record(info, start, sql_trace)
+
+    def record(self, info: GraphQLResolveInfo, start: float, sql_trace: typing.List[typing.Tuple[str, float]]):
+        seconds = time.perf_counter() - start
+        timing = self.fields.setdefault(f"{info.parent_type.name}.{info.field_name}", FieldTiming())
+        timing.calls += 1
+        timing.seconds += seconds
+        timing.max_seconds = max(timing.max_seconds, seconds)
+        timing.sql_statements += len(sql_trace)
+        timing.sql_seconds += sum(statement_seconds for _, statement_seconds in sql_trace)
+        path = ".".join(str(key) for key in info.path.as_list())
+        self.resolver_calls.append((seconds, path, sql_trace))
+
+    def get_trace(self, seconds: float) -> dict:
+        slowest = sorted(self.resolver_calls, key=lambda call: call[0], reverse=True)[:SLOWEST_RESOLVERS_LOGGED]
+        return {
+            "operation_name": self.execution_context.operation_name,
+            "duration_ms": seconds * 1000,
+            "phases_ms": {name: phase_seconds * 1000 for name, phase_seconds in self.phases.items()},
+            "query": STRING_LITERAL_PATTERN.sub('"[redacted]"', self.execution_context.query or ""),
+            "variables": redact(self.execution_context.variables or {}),
+            "fields": dict(sorted(
+                ((name, asdict(timing)) for name, timing in self.fields.items()),
+                key=lambda item: item[1]["seconds"], reverse=True
+            )),
+            "slowest_resolvers": [
+                {
+                    "path": path,
+                    "duration_ms": call_seconds * 1000,
+                    "sql": [{"statement": statement_shape(statement), "duration_ms": statement_seconds * 1000}
+                            for statement, statement_seconds in sql_trace]
+                }
+                for call_seconds, path, sql_trace in slowest
+            ]
+        }
@@ -0,0 +1,75 @@
+from sqlmodel import SQLModel, and_, or_
+from sqlalchemy.sql.elements import ColumnElement
+from datetime import datetime
+import sqlalchemy
+import strawberry
+import typing
+
+
+def create_filter_type(name: str, type_: typing.Any, comparable: bool = True, like: bool = False):
+    """
+    Input with the operators available for a column of type_. Every operator given
+    in one filter has to match.
+    """
+    annotations: typing.Dict[str, typing.Any] = {
+        "eq": typing.Optional[type_],
+        "in_": typing.Optional[typing.List[type_]],
+        "is_null": typing.Optional[bool]
+    }
+    if comparable:
+        annotations.update({op: typing.Optional[type_] for op in ("gt", "gte", "lt", "lte")})
+    if like:
+        annotations["like"] = typing.Optional[str]
+
+    attrs: typing.Dict[str, typing.Any] = {field: None for field in annotations}
+    attrs["in_"] = strawberry.field(name="in", default=None)
+    attrs["__annotations__"] = annotations
+    return strawberry.input(type(name, (object,), attrs))
+
+
+FILTER_TYPES = {
+    int: create_filter_type("IntFilter", int),
+    float: create_filter_type("FloatFilter", float),
+    str: create_filter_type("StringFilter", str, like=True),
+    bool: create_filter_type("BooleanFilter", bool, comparable=False),
+    datetime: create_filter_type("DateTimeFilter", datetime)
+}
+
+FILTER_OPERATORS = {
+    "eq": lambda column, value: column == value,
+    "in_": lambda column, value: column.in_(value),
+    "gt": lambda column, value: column > value,
+    "gte": lambda column, value: column >= value,
+    "lt": lambda column, value: column < value,
+    "lte": lambda column, value: column <= value,
+    "like": lambda column, value: column.like(value),
+    "is_null": lambda column, value: column.is_(None) if value else column.is_not(None)
+}
+
+
+def compile_where(where: typing.Any, model: typing.Type[SQLModel]) -> ColumnElement:
+    """
+    Compiles a generated {Model}Where input into a WHERE condition on model.
+    Conditions on relationships become EXISTS subqueries correlated with model,
+    so the same condition works for plain and joined (grouped) queries.
+    """
+    relationships = sqlalchemy.inspect(model).relationships
+    conditions = []
+    for field_name, value in vars(where).items():
+        if value is None:
+            continue
+        if field_name == "and_":
+            conditions.append(and_(*[compile_where(nested, model) for nested in value]))
+        elif field_name == "or_":
+            conditions.append(or_(*[compile_where(nested, model) for nested in value]))
+        elif field_name in relationships:
+            relationship = relationships[field_name]
+            condition = compile_where(value, relationship.mapper.class_)
+            attribute = getattr(model, field_name)
+            conditions.append(attribute.any(condition) if relationship.uselist else attribute.has(condition))
+        else:
+            column = getattr(model, field_name)
+            for operator, operator_value in vars(value).items():
+                if operator_value is not None:
+                    conditions.append(FILTER_OPERATORS[operator](column, operator_value))
+    return and_(*conditions) if conditions else sqlalchemy.true()
@@ -1,15 +1,66 @@
+import asyncio
 import strawberry
 from fastapi import Depends
+from sqlmodel.ext.asyncio.session import AsyncSession
+from strawberry.fastapi import GraphQLRouter
+from typing import Callable
 
 from api.database import get_session
+from api.startup_timing import startup_timer
 from api.routers.GraphQL.query_factory import QueryFactory
-from api.routers.GraphQL.mutations import Mutation
+from api.routers.GraphQL.extensions import (
+    OperationNameExtension, DatabaseRoutingExtension, TracingExtension, ResultCacheExtension
+)
+from api.config.envs import GRAPHQL_TRACING, RESULT_CACHE_ENABLED
 
 
-async def get_context(db_session=Depends(get_session)):
+async def get_context(db_session: AsyncSession = Depends(get_session)):
+    # queries read from a replica even when sent with POST, DatabaseRoutingExtension moves mutations to the primary
+    db_session.info["primary"] = False
     return {
-        "db_session": db_session
+        "db_session": db_session,
+        "db_lock": asyncio.Lock()
     }
 
-Query = QueryFactory().create_query()
-schema = strawberry.Schema(query=Query, mutation=Mutation)
+
+_schema: strawberry.Schema | None = None
+
+
+def get_schema() -> strawberry.Schema:
+    """
+    Builds the schema on first use. Walking all models and creating the dynamic
+    types is the most expensive part of importing the app, so it is kept out of cold start.
+    """
+    global _schema
+    if _schema is None:
+        with startup_timer.phase("schema construction"):
+            factory = QueryFactory()
+            Query = factory.create_query()
+            Mutation = factory.create_mutation()
+            extensions: list = [OperationNameExtension, DatabaseRoutingExtension]
+            if GRAPHQL_TRACING:
+                extensions.append(TracingExtension)
+            if RESULT_CACHE_ENABLED:
+                extensions.append(ResultCacheExtension)
+            _schema = strawberry.Schema(query=Query, mutation=Mutation, extensions=extensions)
+        startup_timer.report("Startup timings after schema construction")
+    return _schema
+
+
+class LazySchemaGraphQLRouter(GraphQLRouter):
+    """
+    GraphQLRouter that builds its schema with schema_factory on the first request.
+    """
+    def __init__(self, schema_factory: Callable[[], strawberry.Schema], **kwargs):
+        self._schema_factory = schema_factory
+        super().__init__(schema=None, **kwargs)     # type: ignore
+
+    @property
+    def schema(self) -> strawberry.Schema:      # type: ignore
+        if self._schema is None:
+            self._schema = self._schema_factory()
+        return self._schema
+
+    @schema.setter
+    def schema(self, value: strawberry.Schema | None):
+        self._schema = value
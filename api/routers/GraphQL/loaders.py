@@ -0,0 +1,158 @@
+from sqlmodel import SQLModel, select, and_
+from sqlalchemy.sql.selectable import FromClause, Select
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.orm import RelationshipProperty
+from strawberry.dataloader import DataLoader
+import sqlalchemy
+import strawberry
+import asyncio
+import typing
+
+from api.grouping import group_keys_condition
+from api.routers.GraphQL.selection import pruned_select, selected_columns
+
+
+async def fetch_all(context: dict, query: Select) -> list:
+    """
+    Runs query on the request session. AsyncSession does not allow concurrent
+    operations while strawberry resolves sibling fields concurrently, so access
+    to the session is serialized with a per-request lock.
+    """
+    lock = context.setdefault("db_lock", asyncio.Lock())
+    async with lock:
+        return list((await context['db_session'].exec(query)).all())
+
+
+class GroupNodesLoader:
+    """
+    Loads nodes of every group returned by a single grouped query at once.
+    Rows for all group keys are fetched with one statement on first access
+    and split into groups in Python, so listing nodes costs one query
+    regardless of the number of groups. Also used to batch relationship targets,
+    grouped by the columns referencing their parents.
+    With keys_query, the grouped query selecting the group keys, rows are joined
+    to the keys instead, so they are matched by the database. Its collation may put
+    values Python tells apart into one group, e.g. 'Bob' and 'bob' on MySQL.
+    """
+    def __init__(
+            self,
+            from_clause: FromClause,
+            model: typing.Type[SQLModel],
+            group_columns: typing.List[ColumnElement],
+            group_keys: typing.List[tuple],
+            columns: typing.Optional[typing.List[str]] = None,
+            condition: typing.Optional[ColumnElement] = None,
+            keys_query: typing.Optional[Select] = None
+        ):
+        self.from_clause = from_clause
+        self.model = model
+        self.group_columns = group_columns
+        self.group_keys = group_keys
+        self.columns = columns
+        self.condition = condition
+        self.keys_query = keys_query
+        self._groups: typing.Optional[asyncio.Future] = None
+
+    async def load(self, context: dict, group_key: tuple) -> list:
+        # every group awaits the same future, so all of them resume together
+        # and their nested fields can be batched again
+        if self._groups is None:
+            self._groups = asyncio.ensure_future(self._load_all(context))
+        groups = await self._groups
+        return groups.get(group_key, [])
+
+    async def _load_all(self, context: dict) -> typing.Dict[tuple, list]:
+        groups: typing.Dict[tuple, list] = {key: [] for key in self.group_keys}
+        if not self.group_keys:
+            return groups
+
+        if self.keys_query is not None:
+            keys = self.keys_query.subquery("group_keys")
+            key_columns: typing.List[ColumnElement] = list(keys.c)
+            from_clause = self.from_clause.join(keys, and_(*[
+                column.is_not_distinct_from(key_column) for column, key_column in zip(self.group_columns, key_columns)
+            ]))
+        else:
+            key_columns = self.group_columns
+            from_clause = self.from_clause
+
+        if self.columns is None:
+            query = select(self.model, *key_columns)
+        else:
+            # plain rows carry the requested columns followed by the group key
+            query = sqlalchemy.select(
+                *pruned_select(self.model, self.columns).selected_columns,
+                *[column.label(f"group_key_{i}") for i, column in enumerate(key_columns)]
+            )
+        query = query.select_from(from_clause)
+        if self.keys_query is None:
+            query = query.where(group_keys_condition(self.group_columns, self.group_keys))
+        if self.condition is not None:
+            query = query.where(self.condition)
+
+        key_start = len(query.selected_columns) - len(self.group_columns)
+        for row in await fetch_all(context, query):
+            group_key = tuple(row[key_start:])
+            if group_key in groups:
+                groups[group_key].append(row[0] if self.columns is None else row)
+        return groups
+
+
+def get_relationship_key_fields(relationship: RelationshipProperty) -> typing.Tuple[typing.List[str], typing.List[str]]:
+    """
+    Returns names of the parent attributes and the matching target attributes
+    that join both sides of the relationship.
+    """
+    local_fields, remote_fields = [], []
+    for local_column, remote_column in relationship.local_remote_pairs:
+        local_fields.append(relationship.parent.get_property_by_column(local_column).key)
+        remote_fields.append(relationship.mapper.get_property_by_column(remote_column).key)
+    return local_fields, remote_fields
+
+
+def get_relationship_loader(
+        info: strawberry.Info,
+        relationship: RelationshipProperty,
+        columns: typing.Optional[typing.List[str]]
+    ) -> DataLoader:
+    """
+    Per-request loader of relationship targets. Keys requested by all parents
+    on one level are collected and loaded with a single query (selectin-style).
+    """
+    loaders = info.context.setdefault("loaders", {})
+    loader_key = (relationship, tuple(columns) if columns is not None else None)
+    if loader_key in loaders:
+        return loaders[loader_key]
+
+    target_model = relationship.mapper.class_
+    _, remote_fields = get_relationship_key_fields(relationship)
+    context = info.context
+
+    async def load_fn(keys: typing.List[tuple]) -> typing.List[typing.Any]:
+        nodes_loader = GroupNodesLoader(
+            from_clause=target_model.__table__,
+            model=target_model,
+            group_columns=[getattr(target_model, field) for field in remote_fields],
+            group_keys=list(keys),
+            columns=columns
+        )
+        results = [await nodes_loader.load(context, key) for key in keys]
+        if relationship.uselist:
+            return results
+        return [nodes[0] if nodes else None for nodes in results]
+
+    loaders[loader_key] = DataLoader(load_fn=load_fn)
+    return loaders[loader_key]
+
+
+def create_relationship_resolver(relationship: RelationshipProperty):
+    local_fields, _ = get_relationship_key_fields(relationship)
+    target_model = relationship.mapper.class_
+
+    async def resolver(root, info: strawberry.Info) -> typing.Any:
+        key = tuple(getattr(root, field) for field in local_fields)
+        if None in key:
+            return [] if relationship.uselist else None
+        columns = selected_columns(info.selected_fields, target_model)
+        return await get_relationship_loader(info, relationship, columns).load(key)
+    return resolver
@@ -1,5 +1,5 @@
-from sqlmodel import SQLModel, func, col, select
-from sqlalchemy.sql.selectable import Select
+from sqlmodel import SQLModel, func
+import sqlalchemy
 import typing
 import types
 import strawberry
@@ -21,20 +21,39 @@ def get_real_type(type_: typing.Any) -> typing.Any:
     return type_
 
 
-class QueryWrapper:
-    def __init__(self, query: Select, model: typing.Type[SQLModel]):
-        self.query = query
-        self.model = model
+# Precomputed aggregate values of one group keyed by (operation, field name)
+AggregateValues = typing.Dict[typing.Tuple[str, typing.Optional[str]], typing.Any]
+
+AGGREGATE_OPERATIONS = {
+    "sum": func.sum,
+    "max": func.max,
+    "min": func.min,
+    "avg": func.avg
+}
+
+
+def get_numeric_fields(model_class: typing.Type[SQLModel]) -> list[str]:
+    numeric_fields: list[str] = []
+    fields_source = getattr(model_class, "model_fields", None) or model_class.__fields__
+    for field_name, field_info in fields_source.items():
+        raw_type = getattr(field_info, "annotation", None) or getattr(field_info, "type_", None)
+        real_type = get_real_type(raw_type)
+        if real_type in [int, float]:
+            numeric_fields.append(field_name)
+    return numeric_fields
 
 
 class BaseTypesMetaclass(type):
     def __new__(cls, name, bases, attrs):
         model_class: SQLModel = attrs.get('model', None)
         allowed_types = attrs.get('allowed_types', None)
+        excluded_fields = attrs.get('excluded_fields', set())
+        optional_default = attrs.get('optional_default', None)
         annotation_for_field_func: typing.Callable = attrs.get(
             'annotation_for_field_func',
             lambda key, field: field.annotation or field.type_
         )
+        relationship_field_func: typing.Optional[typing.Callable] = attrs.get('relationship_field_func', None)
 
         if model_class is None:
             raise Exception(
@@ -45,7 +64,7 @@ class BaseTypesMetaclass(type):
 
         fields_source = getattr(model_class, "model_fields", None) or model_class.__fields__
         for field_name, field_info in fields_source.items():
-            if field_name in annotations:
+            if field_name in annotations or field_name in excluded_fields:
                 continue
 
             raw_type = getattr(field_info, "annotation", None) or getattr(field_info, "type_", None)
@@ -55,13 +74,21 @@ class BaseTypesMetaclass(type):
                 target_type = annotation_for_field_func(field_name, field_info)
                 annotations[field_name] = target_type
                 if is_optional(target_type):
-                    attrs[field_name] = None
+                    attrs[field_name] = optional_default
 
         attrs['__annotations__'] = annotations
+
+        if relationship_field_func is not None:
+            for relationship in sqlalchemy.inspect(model_class).relationships:
+                if relationship.key not in annotations and relationship.key not in attrs:
+                    attrs[relationship.key] = relationship_field_func(relationship.key, relationship)
         
         if 'model' in attrs: del attrs['model']
         if 'allowed_types' in attrs: del attrs['allowed_types']
+        if 'excluded_fields' in attrs: del attrs['excluded_fields']
+        if 'optional_default' in attrs: del attrs['optional_default']
         if 'annotation_for_field_func' in attrs: del attrs['annotation_for_field_func']
+        if 'relationship_field_func' in attrs: del attrs['relationship_field_func']
         
         return super().__new__(cls, name, bases, attrs)
 
@@ -72,57 +99,27 @@ class AgregateTypeMetaclass(type):
         if not model_class:
             return super().__new__(cls, name, bases, attrs)
 
-        numeric_fields: list[str] = []
-        fields_source = getattr(model_class, "model_fields", None) or model_class.__fields__
-        
-        for field_name, field_info in fields_source.items():
-            raw_type = getattr(field_info, "annotation", None) or getattr(field_info, "type_", None)
-            real_type = get_real_type(raw_type)
-            if real_type in [int, float]:
-                numeric_fields.append(field_name)
+        numeric_fields = get_numeric_fields(model_class)
 
-        def count_resolver(root: QueryWrapper, info: strawberry.Info) -> int:
-            db_session = info.context['db_session']
-            count_subquery = select(func.count("*")).select_from(root.query.subquery())
-            result = db_session.exec(count_subquery).one_or_none()
+        def count_resolver(root: AggregateValues) -> int:
+            result = root.get(("count", None))
             return int(result) if result else 0
 
-        def create_aggregate_resolver(func_sqlalchemy, column_name):
-            def resolver(root: QueryWrapper, info: strawberry.Info) -> float:
-                db_session = info.context['db_session']
-                field_col = getattr(root.model, column_name)
-                agg_query = root.query.with_only_columns(func_sqlalchemy(col(field_col)))
-                result = db_session.exec(agg_query).one_or_none()
+        def create_aggregate_resolver(op_name: str, column_name: str):
+            def resolver(root: AggregateValues) -> float:
+                result = root.get((op_name, column_name))
                 return float(result) if result else 0.0
             return resolver
 
-        def create_avg_resolver(column_name: str):
-            def avg_resolver(root: QueryWrapper, info: strawberry.Info) -> float:
-                total_sum = create_aggregate_resolver(func.sum, column_name)(root, info)
-                total_count = count_resolver(root, info)
-                if total_count == 0:
-                    return 0
-                return total_sum / total_count
-            return avg_resolver
-
-        operations = {
-            "sum": {"func": func.sum, "is_sql_func": True},
-            "max": {"func": func.max, "is_sql_func": True},
-            "min": {"func": func.min, "is_sql_func": True},
-            "avg": {"func": create_avg_resolver, "is_sql_func": False}
-        }
-        for op_name, func_dict in operations.items():
+        for op_name in AGGREGATE_OPERATIONS:
             op_fields = {}
             for field in numeric_fields:
-                resolver = create_aggregate_resolver(func_dict["func"], field) \
-                    if func_dict["is_sql_func"] \
-                    else func_dict["func"](field)
-                op_fields[field] = strawberry.field(resolver=resolver)
+                op_fields[field] = strawberry.field(resolver=create_aggregate_resolver(op_name, field))
 
             AggregateDynamicClass = strawberry.type(
                 type(f"{name}{op_name.capitalize()}", (object,), op_fields)
             )
-            def pass_through(root: QueryWrapper) -> typing.Optional[AggregateDynamicClass]:
+            def pass_through(root: AggregateValues) -> typing.Optional[AggregateDynamicClass]:
                 return root     # type: ignore
             attrs[op_name] = strawberry.field(resolver=pass_through)
         
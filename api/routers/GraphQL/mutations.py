@@ -1,8 +1,133 @@
 import strawberry
+import typing
+from datetime import datetime
+from sqlmodel import SQLModel
 
+from api.bulk import get_primary_key, batched, bulk_insert, bulk_update, bulk_delete
+from api.config.envs import BULK_BATCH_SIZE
+from api.database import transaction
+from api.routers.GraphQL.metaclasses import BaseTypesMetaclass, is_optional
+from api.routers.GraphQL.loaders import fetch_all
+from api.routers.GraphQL.selection import selected_columns, pruned_select
 
-@strawberry.type
-class Mutation:
-    @strawberry.mutation
-    def create_flavour(self, name: str, info: strawberry.Info) -> bool:
-        return True
+
+INPUT_TYPES = {int, str, float, bool, datetime}
+
+
+async def select_by_ids(info: strawberry.Info, model: typing.Type[SQLModel], ids: typing.List[typing.Any]) -> list:
+    """
+    Fetches only the selected fields of rows with given primary keys, in the order of ids.
+    """
+    primary_key = get_primary_key(model)
+    columns = selected_columns(info.selected_fields, model)
+    if columns is not None and primary_key.key not in columns:
+        columns.append(primary_key.key)
+
+    rows = await fetch_all(info.context, pruned_select(model, columns).where(primary_key.in_(ids)))
+    rows_by_id = {getattr(row, primary_key.key): row for row in rows}
+    return [rows_by_id[id_] for id_ in ids if id_ in rows_by_id]
+
+
+def provided_fields(record: typing.Any) -> dict:
+    return {field: value for field, value in vars(record).items() if value is not strawberry.UNSET}
+
+
+class MutationFactory:
+    """
+    Generates batched create/update/delete mutations for every model that has a GraphQL entity type.
+    Each mutation runs one INSERT/UPDATE/DELETE statement for the whole input list in a single transaction.
+    """
+    def __init__(self, entity_types: typing.Dict[typing.Type[SQLModel], typing.Any]):
+        self._entity_types = entity_types
+
+    def create_mutation(self):
+        mutation_fields = {}
+        for model, EntityType in self._entity_types.items():
+            mutation_fields.update(self._create_resolvers(model.__name__, model, EntityType))
+        return strawberry.type(type("Mutation", (object,), mutation_fields))
+
+    def _create_resolvers(self, model_name: str, model: typing.Type[SQLModel], EntityType: typing.Any):
+        InputType, UpdateInputType = self._create_input_types(model_name, model)
+        primary_key = get_primary_key(model)
+
+        async def create_resolver(
+                info: strawberry.Info,
+                input: typing.List[InputType]
+            ) -> typing.List[EntityType]:
+                # model_validate fills in model defaults for fields that were not provided
+                rows = [
+                    model.model_validate(provided_fields(record)).model_dump(exclude={primary_key.key})
+                    for record in input
+                ]
+                ids = []
+                async with transaction(info.context["db_session"], model) as rollup_changes:
+                    # very large inputs are split to stay under the database's parameter limits
+                    for batch in batched(rows, BULK_BATCH_SIZE):
+                        ids.extend(await bulk_insert(info.context["db_session"], model, batch))
+                    await rollup_changes.collect(model, ids)
+                return await select_by_ids(info, model, ids)
+
+        async def update_resolver(
+                info: strawberry.Info,
+                input: typing.List[UpdateInputType]
+            ) -> typing.List[EntityType]:
+                rows = [provided_fields(record) for record in input]
+                ids = list(dict.fromkeys(row[primary_key.key] for row in rows))
+                async with transaction(info.context["db_session"], model) as rollup_changes:
+                    # rows may move between groups, groups before and after the update change
+                    await rollup_changes.collect(model, ids)
+                    await bulk_update(info.context["db_session"], model, rows)
+                    await rollup_changes.collect(model, ids)
+                    updated = await select_by_ids(info, model, ids)
+                    if len(updated) != len(ids):
+                        found = {getattr(row, primary_key.key) for row in updated}
+                        raise Exception(f"{model_name} not found: {[id_ for id_ in ids if id_ not in found]}")
+                return updated
+
+        async def delete_resolver(
+                info: strawberry.Info,
+                ids: typing.List[int]
+            ) -> typing.List[EntityType]:
+                async with transaction(info.context["db_session"], model) as rollup_changes:
+                    # deleted rows are returned, so selected fields are read before deleting
+                    deleted = await select_by_ids(info, model, list(dict.fromkeys(ids)))
+                    await rollup_changes.collect(model, [getattr(row, primary_key.key) for row in deleted])
+                    await bulk_delete(info.context["db_session"], model, [getattr(row, primary_key.key) for row in deleted])
+                return deleted
+
+        return {
+            f"create_{model_name.lower()}s": strawberry.mutation(resolver=create_resolver),
+            f"update_{model_name.lower()}s": strawberry.mutation(resolver=update_resolver),
+            f"delete_{model_name.lower()}s": strawberry.mutation(resolver=delete_resolver)
+        }
+
+    def _create_input_types(self, model_name: str, model_class: typing.Type[SQLModel]):
+        primary_key_name = get_primary_key(model_class).key
+
+        @strawberry.input(name=f"{model_name}Input")
+        class InputType(metaclass=BaseTypesMetaclass):
+            model = model_class
+            allowed_types = INPUT_TYPES
+            excluded_fields = {primary_key_name}
+            # fields with a default in the model can be omitted
+            annotation_for_field_func = lambda key, field: \
+                field.annotation if field.is_required() or is_optional(field.annotation) \
+                else typing.Optional[field.annotation]
+            optional_default = strawberry.UNSET
+
+        @strawberry.input(name=f"{model_name}UpdateInput")
+        class UpdateInputType(metaclass=BaseTypesMetaclass):
+            model = model_class
+            allowed_types = INPUT_TYPES
+            # every field but the primary key can be omitted, omitted fields are left unchanged
+            annotation_for_field_func = lambda key, field: \
+                get_required_annotation(field.annotation) if key == primary_key_name \
+                else typing.Optional[field.annotation]
+            optional_default = strawberry.UNSET
+
+        return InputType, UpdateInputType
+
+
+def get_required_annotation(annotation: typing.Any) -> typing.Any:
+    args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+    return args[0] if is_optional(annotation) and len(args) == 1 else annotation
@@ -1,12 +1,26 @@
 import strawberry
 import typing
 import inspect
-import sqlalchemy
 from enum import Enum
-from sqlmodel import Session, select, SQLModel
+from sqlmodel import select, SQLModel, and_
+from sqlalchemy.orm import RelationshipProperty
+from strawberry.annotation import StrawberryAnnotation
+from strawberry.types.field import StrawberryField
 
 import api.models as models
-from api.routers.GraphQL.metaclasses import QueryWrapper, BaseTypesMetaclass, AgregateTypeMetaclass
+from api.pagination import OrderKey, keyset_order, apply_keyset, keyset_condition, encode_cursor, decode_cursor
+from api.routers.GraphQL.metaclasses import AggregateValues, BaseTypesMetaclass, AgregateTypeMetaclass, get_real_type
+from api.routers.GraphQL.aggregates import (
+    AggregateRef, HavingFilter, AggregateExpressionFunc, plan_aggregates, aggregate_columns,
+    aggregate_expression, get_aggregate_key, having_conditions
+)
+from api.grouping import resolve_group_by
+from api.rollups import find_rollup
+from api.sql_instrumentation import current_read_tables
+from api.routers.GraphQL.loaders import GroupNodesLoader, create_relationship_resolver, fetch_all
+from api.routers.GraphQL.selection import find_selections, selected_columns, pruned_select
+from api.routers.GraphQL.mutations import MutationFactory
+from api.routers.GraphQL.filters import FILTER_TYPES, compile_where
 
 
 @strawberry.type
@@ -21,7 +35,76 @@ class OrderByDirection(Enum):
     desc = "desc"
 
 
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    end_cursor: typing.Optional[str]
+
+
+@strawberry.input
+class GroupOrderBy:
+    key: typing.Optional[str] = None
+    aggregate: typing.Optional[AggregateRef] = None
+    direction: OrderByDirection = OrderByDirection.asc
+
+
+CONNECTION_DEFAULT_PAGE_SIZE = 100
+
+
+def get_order_keys(order_by: typing.Optional[typing.List[typing.Any]]) -> typing.List[OrderKey]:
+    order_keys = []
+    for order_by_component in order_by or []:
+        for field, direction in vars(order_by_component).items():
+            if direction:
+                order_keys.append((field, direction == OrderByDirection.desc))
+    return order_keys
+
+
+def get_group_order_terms(
+        order_by: typing.Optional[typing.List[GroupOrderBy]],
+        group_by: typing.List[str],
+        group_columns: typing.List[typing.Any],
+        model: typing.Type[SQLModel],
+        expression_func: typing.Optional[AggregateExpressionFunc] = None
+    ) -> typing.List[typing.Tuple[str, typing.Any, bool]]:
+    """
+    Returns (cursor field name, expression, descending) for every ordering term of a grouped query,
+    followed by the remaining group columns. Group keys are unique, so the ordering is total.
+    """
+    expression_func = expression_func or (lambda key: aggregate_expression(key, model))
+    order_terms = []
+    for order_component in order_by or []:
+        descending = order_component.direction == OrderByDirection.desc
+        if (order_component.key is None) == (order_component.aggregate is None):
+            raise Exception("Order groups either by a key or by an aggregate")
+        if order_component.key is not None:
+            if order_component.key not in group_by:
+                raise Exception(f"'{order_component.key}' is not one of the grouped fields")
+            i = group_by.index(order_component.key)
+            order_terms.append((f"key_{i}", group_columns[i], descending))
+        else:
+            op_name, field_name = get_aggregate_key(order_component.aggregate, model)
+            order_terms.append((
+                f"{op_name}_{field_name or 'all'}",
+                expression_func((op_name, field_name)),
+                descending
+            ))
+
+    ordered = {name for name, _, _ in order_terms}
+    for i, column in enumerate(group_columns):
+        if f"key_{i}" not in ordered:
+            order_terms.append((f"key_{i}", column, False))
+    return order_terms
+
+
 class QueryFactory:
+    def __init__(self):
+        self._entity_types: typing.Dict[typing.Type[SQLModel], typing.Any] = {}
+        self._relationship_fields: typing.List[typing.Tuple[StrawberryField, RelationshipProperty]] = []
+        self._where_types: typing.Dict[typing.Type[SQLModel], typing.Any] = {}
+        # (field, model whose where input it takes, whether it takes a list)
+        self._where_fields: typing.List[typing.Tuple[StrawberryField, typing.Type[SQLModel], bool]] = []
+
     def create_query(self):
         query_fields = {}
 
@@ -31,101 +114,196 @@ class QueryFactory:
                 fields = self._create_resolvers_ad_types(name, obj)
                 query_fields.update(fields)
 
+        self._resolve_relationship_types()
         Query = strawberry.type(type("Query", (object,), query_fields))
         return Query
 
+    def create_mutation(self):
+        """
+        Mutations for every model registered by create_query, which has to be called first.
+        """
+        return MutationFactory(self._entity_types).create_mutation()
+
+    def _create_relationship_field(self, field_name: str, relationship: RelationshipProperty) -> StrawberryField:
+        # target types may not exist yet, they are set in _resolve_relationship_types
+        field = strawberry.field(resolver=create_relationship_resolver(relationship))
+        self._relationship_fields.append((field, relationship))
+        return field
+
+    def _create_where_field(self, model: typing.Type[SQLModel], is_list: bool = False,
+                            name: typing.Optional[str] = None) -> StrawberryField:
+        # where inputs reference each other, their types are set in _resolve_relationship_types
+        field = strawberry.field(name=name, default=None, graphql_type=typing.Optional[typing.Any])
+        self._where_fields.append((field, model, is_list))
+        return field
+
+    def _resolve_relationship_types(self):
+        for field, relationship in self._relationship_fields:
+            target_type = self._entity_types[relationship.mapper.class_]
+            field.type_annotation = StrawberryAnnotation(
+                typing.List[target_type] if relationship.uselist else typing.Optional[target_type]
+            )
+        for field, model, is_list in self._where_fields:
+            where_type = self._where_types[model]
+            field.type_annotation = StrawberryAnnotation(
+                typing.Optional[typing.List[where_type]] if is_list else typing.Optional[where_type]
+            )
+
     def _create_resolvers_ad_types(self, model_name: str, model: typing.Type[SQLModel]):
-        EntityType, GroupResultType, OrderByType = self._create_model_types(model_name, model)
+        EntityType, GroupResultType, OrderByType, ConnectionType, EdgeType, WhereType = \
+            self._create_model_types(model_name, model)
 
-        def base_class_query(
+        async def base_class_query(
                 info: strawberry.Info,
                 order_by: typing.Optional[typing.List[OrderByType]] = None,
                 offset: typing.Optional[int] = None,
-                limit: typing.Optional[int] = None
+                limit: typing.Optional[int] = None,
+                where: typing.Optional[WhereType] = None
             ) -> typing.List[EntityType]:
-                db_session: Session = info.context['db_session']
-                query = select(model)
+                query = pruned_select(model, selected_columns(info.selected_fields, model))
+                if where is not None:
+                    query = query.where(compile_where(where, model))
 
-                if order_by:
-                    for order_by_component in order_by:
-                        for field, direction in vars(order_by_component).items():
-                            if direction and direction == OrderByDirection.desc:
-                                query = query.order_by(getattr(model, field).desc())
-                            elif direction:
-                                query = query.order_by(getattr(model, field))                    
+                for field, descending in get_order_keys(order_by):
+                    column = getattr(model, field)
+                    query = query.order_by(column.desc() if descending else column)
 
                 if offset:
                     query = query.offset(offset)
                 if limit:
                     query = query.limit(limit)
-                result = db_session.exec(query).all()        
-                return result    #type: ignore
+                return await fetch_all(info.context, query)    #type: ignore
 
-        def grouped_query( 
-            info: strawberry.Info, 
-            group_by: typing.List[str]
+        async def connection_query(
+                info: strawberry.Info,
+                first: int = CONNECTION_DEFAULT_PAGE_SIZE,
+                after: typing.Optional[str] = None,
+                order_by: typing.Optional[typing.List[OrderByType]] = None,
+                where: typing.Optional[WhereType] = None
+            ) -> ConnectionType:
+                if first < 0:
+                    raise Exception("'first' can't be negative")
+
+                order = keyset_order(model, get_order_keys(order_by))
+                columns = selected_columns(find_selections(info.selected_fields, ["edges", "node"]), model)
+                if columns is not None:
+                    columns += [field for field, _ in order if field not in columns]
+                query = pruned_select(model, columns)
+                if where is not None:
+                    query = query.where(compile_where(where, model))
+                query = apply_keyset(query, model, order, after).limit(first + 1)
+                rows = await fetch_all(info.context, query)
+
+                edges = [EdgeType(cursor=encode_cursor(order, row), node=row) for row in rows[:first]]
+                page_info = PageInfo(
+                    has_next_page=len(rows) > first,
+                    end_cursor=edges[-1].cursor if edges else None
+                )
+                return ConnectionType(edges=edges, page_info=page_info)
+
+        async def grouped_query(
+            info: strawberry.Info,
+            group_by: typing.List[str],
+            order_by: typing.Optional[typing.List[GroupOrderBy]] = None,
+            having: typing.Optional[typing.List[HavingFilter]] = None,
+            offset: typing.Optional[int] = None,
+            limit: typing.Optional[int] = None,
+            after: typing.Optional[str] = None,
+            where: typing.Optional[WhereType] = None
         ) -> typing.List[GroupResultType]:
             if len(group_by) == 0:
                 raise Exception("Provide at least one field to group by")
 
-            db_session = info.context['db_session']
-            joins_needed = []
-            joined_paths = set()
-
-            group_columns = []
-            for field_name in group_by:
-                field_name = field_name.lower()
-                if model_name.lower() in field_name:
-                    raise Exception("You can't join the same model")
-                current_model = model
-                path_prefix = ""
-
-                field_parts = field_name.split(".")
-                for field_part in field_parts[:-1]:
-                    mapper = sqlalchemy.inspect(current_model)
-                    if mapper is None or field_part not in mapper.relationships:
-                        raise Exception(f"Relationship '{field_part}' not found in model {current_model.__name__}")
-
-                    relationship_attr = mapper.relationships[field_part]
-                    target_model = relationship_attr.mapper.class_
-                    path_key = f"{path_prefix}.{field_part}"
-                    
-                    if path_key not in joined_paths:
-                        joins_needed.append(target_model)
-                        joined_paths.add(path_key)
-
-                    current_model = target_model
-                    path_prefix = path_key
-
-                if not hasattr(current_model, field_parts[-1]):
-                    raise Exception(f"Field {field_name} not found in model")
-                group_columns.append(getattr(current_model, field_parts[-1]))
-
-            query = select(model)
-            for join_model in joins_needed:
-                query = query.join(join_model)
-            from_clause = query.get_final_froms()[0]
-            group_by_query = (
-                select(*group_columns)
-                .select_from(from_clause)
-                .group_by(*group_columns)
+            group_columns, from_clause = resolve_group_by(model, group_by)
+            aggregate_plan = plan_aggregates(info, model)
+
+            # a rollup holds one row per group already, it can answer unless rows have to be filtered
+            rollup = None
+            if where is None:
+                refs = [having_filter.aggregate for having_filter in having or []] + [
+                    order_component.aggregate for order_component in order_by or []
+                    if order_component.aggregate is not None
+                ]
+                rollup = find_rollup(model, group_by, aggregate_plan + [get_aggregate_key(ref, model) for ref in refs])
+                if rollup is not None and not rollup.built:
+                    # built by python -m api.rollups rebuild while this instance was running
+                    rollup.built = bool(await fetch_all(info.context, rollup.built_query()))
+                    if not rollup.built:
+                        rollup = None
+            if rollup is not None:
+                key_columns = rollup.key_columns(group_by)
+                expression_func: AggregateExpressionFunc = rollup.aggregate_expression
+                source = rollup.table
+                # cached results have to be invalidated by writes to the rows the rollup summarizes
+                read_tables = current_read_tables.get()
+                if read_tables is not None:
+                    read_tables.update(rollup.source_tables)
+            else:
+                key_columns = group_columns
+                expression_func = lambda key: aggregate_expression(key, model)
+                source = from_clause
+
+            order_terms = get_group_order_terms(order_by, group_by, key_columns, model, expression_func)
+            order: typing.List[OrderKey] = [(name, descending) for name, _, descending in order_terms]
+            order_expressions = [expression for _, expression, _ in order_terms]
+
+            # ordering values are selected too, the cursor of every group is built from them
+            statement_columns = [
+                *key_columns,
+                *aggregate_columns(aggregate_plan, model, expression_func),
+                *[expression.label(name) for name, expression, _ in order_terms]
+            ]
+            where_condition = compile_where(where, model) if where is not None else None
+            group_by_query = select(*statement_columns).select_from(source)
+            if where_condition is not None:
+                group_by_query = group_by_query.where(where_condition)
+            if rollup is None:
+                group_by_query = group_by_query.group_by(*group_columns)
+            group_by_query = group_by_query.order_by(*[
+                expression.desc() if descending else expression
+                for _, expression, descending in order_terms
+            ])
+
+            # filters on aggregates and the cursor seek condition can only be applied in HAVING,
+            # or in WHERE of a rollup, whose rows are groups already
+            conditions = having_conditions(having or [], model, expression_func)
+            if after is not None:
+                conditions.append(keyset_condition(order_expressions, order, decode_cursor(order, after)))
+            if conditions:
+                group_by_query = group_by_query.having(and_(*conditions)) if rollup is None \
+                    else group_by_query.where(and_(*conditions))
+            if offset:
+                group_by_query = group_by_query.offset(offset)
+            if limit is not None:
+                group_by_query = group_by_query.limit(limit)
+
+            rows = await fetch_all(info.context, group_by_query)
+            group_keys = [tuple(row[:len(group_columns)]) for row in rows]
+            nodes_loader = GroupNodesLoader(
+                from_clause=from_clause,
+                model=model,
+                group_columns=group_columns,
+                group_keys=group_keys,
+                columns=selected_columns(find_selections(info.selected_fields, ["nodes"]), model),
+                condition=where_condition,
+                # the grouped query again, nodes are matched to the keys it returns by the database
+                keys_query=group_by_query.with_only_columns(*[
+                    column.label(f"group_key_{i}") for i, column in enumerate(key_columns)
+                ])
             )
 
-            results = db_session.exec(group_by_query).all()
-
             grouped_results = []
-            for row in results:
-                row_values = [row] if len(group_columns) == 1 else row
-                keys_dict = {}
-                one_record_query = query.with_only_columns(model)
-                for i, col_val in enumerate(row_values):
-                    one_record_query = one_record_query.where(group_columns[i] == col_val)
-                    keys_dict[group_by[i]] = col_val
+            for group_key, row in zip(group_keys, rows):
+                keys_dict = {group_by[i]: col_val for i, col_val in enumerate(group_key)}
+                aggregates = dict(zip(aggregate_plan, row[len(group_columns):]))
 
                 grouped_results.append(
-                    GroupResultType(keys=keys_dict, query_wrapper=QueryWrapper(
-                        query=one_record_query, model=model
-                        )
+                    GroupResultType(
+                        keys=keys_dict,
+                        aggregates=aggregates,
+                        nodes_loader=nodes_loader,
+                        group_key=group_key,
+                        cursor=encode_cursor(order, row)
                     )
                 )
 
@@ -133,6 +311,7 @@ class QueryFactory:
 
         return {
             f"{model_name.lower()}s": strawberry.field(resolver=base_class_query),
+            f"{model_name.lower()}s_connection": strawberry.field(resolver=connection_query),
             f"{model_name.lower()}s_grouped": strawberry.field(resolver=grouped_query)
         }
 
@@ -140,7 +319,9 @@ class QueryFactory:
         @strawberry.type(name=model_name)
         class EntityType(metaclass=BaseTypesMetaclass):
             model = model_class
-        
+            relationship_field_func = self._create_relationship_field
+        self._entity_types[model_class] = EntityType
+
         AggregateType = strawberry.type(
             AgregateTypeMetaclass(f"{model_name}Aggregate", (object,), {"model": model_class})
         )
@@ -148,25 +329,30 @@ class QueryFactory:
         @strawberry.type(name=f"{model_name}GroupResult")
         class GroupResultType:
             _keys: strawberry.Private[dict]
-            _query_wrapper: strawberry.Private[QueryWrapper]
+            _aggregates: strawberry.Private[AggregateValues]
+            _nodes_loader: strawberry.Private[GroupNodesLoader]
+            _group_key: strawberry.Private[tuple]
+            cursor: str
 
-            def __init__(self, keys: dict, query_wrapper: QueryWrapper):
+            def __init__(self, keys: dict, aggregates: AggregateValues,
+                         nodes_loader: GroupNodesLoader, group_key: tuple, cursor: str):
                 self._keys = keys
-                self._query_wrapper = query_wrapper
+                self._aggregates = aggregates
+                self._nodes_loader = nodes_loader
+                self._group_key = group_key
+                self.cursor = cursor
 
             @strawberry.field
             def keys(self) -> typing.List[GroupKey]:
                 return [GroupKey(name=k, value=str(v)) for k, v in self._keys.items()]
 
             @strawberry.field
-            def nodes(self, info: strawberry.Info) -> typing.List[EntityType]:
-                db_session = info.context['db_session']
-                results = db_session.exec(self._query_wrapper.query).all()
-                return results
+            async def nodes(self, info: strawberry.Info) -> typing.List[EntityType]:
+                return await self._nodes_loader.load(info.context, self._group_key)
 
             @strawberry.field
             def aggregate(self) -> AggregateType:
-                return self._query_wrapper # type: ignore
+                return self._aggregates # type: ignore
 
         @strawberry.input(name=f"OrderBy{model_name}")
         class OrderByType(metaclass=BaseTypesMetaclass):
@@ -174,4 +360,25 @@ class QueryFactory:
             allowed_types = {int, str, float, bool}
             annotation_for_field_func = lambda *args, **kwargs: typing.Optional[OrderByDirection]
 
-        return EntityType, GroupResultType, OrderByType
+        @strawberry.type(name=f"{model_name}Edge")
+        class EdgeType:
+            cursor: str
+            node: EntityType
+
+        @strawberry.type(name=f"{model_name}Connection")
+        class ConnectionType:
+            edges: typing.List[EdgeType]
+            page_info: PageInfo
+
+        @strawberry.input(name=f"{model_name}Where")
+        class WhereType(metaclass=BaseTypesMetaclass):
+            model = model_class
+            allowed_types = set(FILTER_TYPES)
+            annotation_for_field_func = lambda key, field: typing.Optional[FILTER_TYPES[get_real_type(field.annotation)]]
+            # relationships take the where input of their target, matching when any related row matches
+            relationship_field_func = lambda key, relationship: self._create_where_field(relationship.mapper.class_)
+            and_ = self._create_where_field(model_class, is_list=True, name="and")
+            or_ = self._create_where_field(model_class, is_list=True, name="or")
+        self._where_types[model_class] = WhereType
+
+        return EntityType, GroupResultType, OrderByType, ConnectionType, EdgeType, WhereType
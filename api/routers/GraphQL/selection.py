@@ -0,0 +1,71 @@
+from sqlmodel import SQLModel, select
+from sqlalchemy.sql.selectable import Select
+from strawberry.types.nodes import Selection, SelectedField
+from strawberry.utils.str_converters import to_camel_case
+import sqlalchemy
+import typing
+
+
+def flatten_selections(selections: typing.List[Selection]) -> typing.List[SelectedField]:
+    fields = []
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            fields.append(selection)
+        else:
+            fields.extend(flatten_selections(selection.selections))
+    return fields
+
+
+def find_selections(fields: typing.List[SelectedField], path: typing.List[str]) -> typing.List[SelectedField]:
+    """
+    Returns every field reached by following path (GraphQL names) from fields,
+    regardless of aliases and fragments.
+    """
+    for name in path:
+        fields = [
+            child for field in fields
+            for child in flatten_selections(field.selections)
+            if child.name == name
+        ]
+    return fields
+
+
+def selected_columns(
+        fields: typing.List[SelectedField],
+        model: typing.Type[SQLModel]
+    ) -> typing.Optional[typing.List[str]]:
+    """
+    Names of model columns requested in the selection set of fields,
+    including columns needed to resolve selected relationships. Returns None when something else than a plain column is requested,
+    which means full ORM objects are needed.
+    """
+    mapper = sqlalchemy.inspect(model)
+    column_names = {to_camel_case(column.key): [column.key] for column in mapper.column_attrs}
+    # relationship fields only need the parent columns the relationship joins on
+    for relationship in mapper.relationships:
+        column_names[to_camel_case(relationship.key)] = [
+            mapper.get_property_by_column(local_column).key
+            for local_column, _ in relationship.local_remote_pairs
+        ]
+
+    requested: typing.Dict[str, None] = {}
+    for field in fields:
+        for child in flatten_selections(field.selections):
+            if child.name == "__typename":
+                continue
+            if child.name not in column_names:
+                return None
+            requested.update(dict.fromkeys(column_names[child.name]))
+    return list(requested)
+
+
+def pruned_select(model: typing.Type[SQLModel], columns: typing.Optional[typing.List[str]]) -> Select:
+    """
+    Selects full ORM objects when columns is None, otherwise only given columns
+    as plain rows, skipping ORM hydration.
+    """
+    if columns is None:
+        return select(model)
+    if not columns:
+        columns = [column.key for column in sqlalchemy.inspect(model).primary_key]
+    return sqlalchemy.select(*[getattr(model, column) for column in columns])
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from azure.core.exceptions import ResourceNotFoundError, ResourceNotModifiedError, HttpResponseError
+from azure.storage.blob.aio import StorageStreamDownloader
+import re
 
 from api.schemas.file_contents_schemas import FileResponse
 from api.dependencies import get_blob_service
-from api.external_services.blob_storage_service import BlobService
+from api.external_services.async_blob_storage_service import AsyncBlobService
 from api.config.BlobHolderService import BlobHolderService
-from api.config.envs import CONFIG_BLOB_NAME
+from api.config.envs import CONFIG_BLOB_NAME, HTTP_CACHE_CONTROL
+from api.http_caching import blob_etag, validator_headers, etag_matches, not_modified
 
 
 blob_holder_service = BlobHolderService()
@@ -14,12 +19,58 @@ router = APIRouter(
     tags=["Files"],
 )
 
+RANGE_PATTERN = re.compile(r"^bytes=(\d+)-(\d*)$")
+
+
+def parse_range_header(range_header: str | None) -> tuple[int, int | None] | None:
+    """
+    Returns (offset, length) of a single 'bytes=start-end' range. Suffix and
+    multipart ranges are not supported and the whole content is sent instead.
+    """
+    if not range_header:
+        return None
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+    start = int(match.group(1))
+    if not match.group(2):
+        return start, None
+    end = int(match.group(2))
+    if end < start:
+        raise HTTPException(status_code=416, detail="Invalid range")
+    return start, end - start + 1
+
+
+async def start_download(service: AsyncBlobService, filename: str, if_none_match: str | None,
+                         offset: int | None = None, length: int | None = None) -> StorageStreamDownloader | Response:
+    try:
+        return await service.download_blob_stream(filename, offset, length, if_none_match)
+    except ResourceNotModifiedError as e:
+        # If-None-Match may be a list, weak or "*", the 304 carries the blob's own ETag
+        etag = e.response.headers.get("ETag") if e.response is not None else None
+        if not etag:
+            etag = await service.get_blob_etag(filename)
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": HTTP_CACHE_CONTROL})
+    except ResourceNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    except HttpResponseError as e:
+        if e.status_code == 416:
+            raise HTTPException(status_code=416, detail="Range not satisfiable")
+        raise e
+
+
 @router.get("/", response_model=FileResponse)
-def get_config() -> FileResponse:
-    config_content = blob_holder_service.get_blob_content(CONFIG_BLOB_NAME)
-    
+def get_config(response: Response, if_none_match: str | None = Header(default=None)) -> FileResponse | Response:
+    snapshot = blob_holder_service.get_snapshot(CONFIG_BLOB_NAME)
+    if snapshot is not None:
+        etag = blob_etag(snapshot)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        response.headers.update(validator_headers(etag))
+    config_content = snapshot.content if snapshot else None
+
     print(f"Reading CONFIG: {config_content}")
-    
+
     return FileResponse(
         message="Hello World!",
         file_content=config_content
@@ -27,9 +78,54 @@ def get_config() -> FileResponse:
 
 
 @router.get("/{filename}", response_model=FileResponse)
-def download(filename: str, service: BlobService = Depends(get_blob_service)):
-    file_content = service.download_blob(filename).decode("utf-8")
+async def download(filename: str,
+                   response: Response,
+                   service: AsyncBlobService = Depends(get_blob_service),
+                   stream: bool = False,
+                   range_header: str | None = Header(default=None, alias="Range"),
+                   if_none_match: str | None = Header(default=None)):
+    if stream:
+        return await stream_download(filename, service, range_header, if_none_match)
+
+    downloader = await start_download(service, filename, if_none_match)
+    if isinstance(downloader, Response):
+        return downloader
+
+    response.headers["ETag"] = downloader.properties.etag
+    response.headers["Cache-Control"] = HTTP_CACHE_CONTROL
     return FileResponse(
         message=f"This is {filename} file",
-        file_content=file_content
+        file_content=(await downloader.readall()).decode("utf-8")
+    )
+
+
+async def stream_download(filename: str, service: AsyncBlobService,
+                          range_header: str | None, if_none_match: str | None) -> Response:
+    requested_range = parse_range_header(range_header)
+    offset, length = requested_range or (None, None)
+
+    downloader = await start_download(service, filename, if_none_match, offset, length)
+    if isinstance(downloader, Response):
+        return downloader
+
+    properties = downloader.properties
+    headers = {
+        "ETag": properties.etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": HTTP_CACHE_CONTROL,
+        "Content-Length": str(downloader.size),
+    }
+    status_code = 200
+    if requested_range is not None:
+        status_code = 206
+        start = offset or 0
+        # properties.size holds the downloaded length, the full size is in the content range
+        total_size = properties.content_range.rsplit("/", 1)[-1]
+        headers["Content-Range"] = f"bytes {start}-{start + downloader.size - 1}/{total_size}"
+
+    return StreamingResponse(
+        downloader.chunks(),
+        status_code=status_code,
+        headers=headers,
+        media_type=properties.content_settings.content_type or "application/octet-stream"
     )
@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from api.database import get_pool_stats, replica_engines
+from api.dependencies import validate_internal_secret
+from api.startup_timing import startup_timer
+from api.sql_instrumentation import sql_metrics
+from api.result_cache import result_cache
+
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"],
+    dependencies=[Depends(validate_internal_secret)]
+)
+
+POOL_COUNTERS = {"checkout_count", "checkout_wait_seconds_total"}
+
+REQUEST_COUNTERS = {
+    "requests": "http_requests_total",
+    "request_seconds": "http_request_seconds_total",
+    "statements": "sql_statements_total",
+    "db_seconds": "sql_db_seconds_total",
+    "n_plus_one": "sql_n_plus_one_total",
+}
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@router.get("/", response_class=PlainTextResponse)
+def get_metrics() -> str:
+    lines = []
+    # primary pool unlabeled, replica pools labeled with their position in DATABASE_REPLICA_CONNECTION_STRINGS
+    pool_stats = [("", get_pool_stats())] + [
+        (f'{{replica="{index}"}}', get_pool_stats(replica)) for index, replica in enumerate(replica_engines)
+    ]
+    for name in pool_stats[0][1]:
+        metric_name = f"db_pool_{name}"
+        lines.append(f"# TYPE {metric_name} {'counter' if name in POOL_COUNTERS else 'gauge'}")
+        for labels, stats in pool_stats:
+            lines.append(f"{metric_name}{labels} {stats[name]}")
+
+    lines.append("# TYPE startup_phase_seconds gauge")
+    for phase, seconds in startup_timer.phases.items():
+        lines.append(f'startup_phase_seconds{{phase="{phase}"}} {seconds}')
+
+    for name, value in result_cache.stats.items():
+        lines.append(f"# TYPE result_cache_{name}_total counter")
+        lines.append(f"result_cache_{name}_total {value}")
+    lines.append("# TYPE result_cache_bytes gauge")
+    lines.append(f"result_cache_bytes {result_cache.size}")
+
+    series = sql_metrics.snapshot()
+    for name, metric_name in REQUEST_COUNTERS.items():
+        lines.append(f"# TYPE {metric_name} counter")
+        for (route, operation), values in series.items():
+            labels = f'route="{escape_label(route)}",operation="{escape_label(operation)}"'
+            lines.append(f"{metric_name}{{{labels}}} {values[name]}")
+    return "\n".join(lines) + "\n"
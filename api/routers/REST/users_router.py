@@ -1,16 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import Session, select, text
-from typing import Annotated
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import select, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.sql.elements import TextClause
+from typing import Annotated, AsyncGenerator
+from pydantic import TypeAdapter, ValidationError
 import logging
 
-from api.models.user_model import UserPublic, UserBase, User, UserUpdate
-from api.database import get_session
-from api.dependencies import validate_internal_secret
-from api.config.BlobHolderService import BlobHolderService
-from api.config.envs import QUERY_BLOB_NAME
+from api.models.user_model import UserPublic, UserBase, User, UserUpdate, UserBulkUpdate
+from api.models.purchase_model import Purchase
+from api.database import get_session, transaction
+from api.pagination import keyset_order, apply_keyset, encode_cursor
+from api.bulk import read_json_records, batched, bulk_insert, bulk_update, bulk_delete
+from api.dependencies import validate_internal_secret, EagerLoad, LoadOptions
+from api.config.BlobHolderService import BlobHolderService, BlobSnapshot
+from api.config.envs import QUERY_BLOB_NAME, BULK_BATCH_SIZE, RESULT_CACHE_ENABLED
+from api.result_cache import result_cache, table_versions
+from api.http_caching import table_etag, validator_headers, etag_matches, not_modified
 
 
-SessionDep = Annotated[Session, Depends(get_session)]
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
+UserListLoadOptions = Annotated[LoadOptions, Depends(EagerLoad(User, {"purchases": selectinload}))]
+UserLoadOptions = Annotated[LoadOptions, Depends(EagerLoad(User, {"purchases": joinedload}))]
+BatchSize = Annotated[int, Query(ge=1, le=10000)]
+UserPublicList = TypeAdapter(list[UserPublic])
 
 blob_holder_service = BlobHolderService()
 
@@ -20,17 +34,80 @@ router = APIRouter(
 )
 
 
+compiled_custom_queries: dict[str, TextClause] = {}
+
+
+def compile_custom_query(snapshot: BlobSnapshot):
+    # called only when the query blob content changes
+    compiled_custom_queries[snapshot.name] = text(snapshot.content)
+
+
+blob_holder_service.add_change_listener(QUERY_BLOB_NAME, compile_custom_query)
+
+# tables user responses are read from, purchases are embedded
+USER_TABLES = ("user", "purchase")
+
+
+def request_cache_key(request: Request, validators: dict[str, str]) -> tuple:
+    # the ETag changes with writes of other instances too, their results aren't served from here
+    return ("rest", request.url.path, tuple(sorted(request.query_params.multi_items())), validators["ETag"])
+
+
+def cached_response(request: Request, validators: dict[str, str]) -> Response | None:
+    if not RESULT_CACHE_ENABLED:
+        return None
+    cached = result_cache.get(request_cache_key(request, validators))
+    if cached is None:
+        return None
+    body, headers = cached
+    return Response(content=body, media_type="application/json", headers={**headers, **validators})
+
+
+def cache_response(request: Request, body: bytes, versions: dict[str, int], validators: dict[str, str],
+                   headers: dict[str, str] | None = None) -> Response:
+    if RESULT_CACHE_ENABLED:
+        result_cache.put(request_cache_key(request, validators), (body, headers or {}), len(body), USER_TABLES, versions)
+    return Response(content=body, media_type="application/json", headers={**(headers or {}), **validators})
+
+
+async def stream_query_results(db_session: AsyncSession, query: TextClause,
+                               batch_size: int) -> AsyncGenerator[bytes, None]:
+    connection = await db_session.connection()
+    try:
+        result = await connection.stream(query)
+        async for rows in result.partitions(batch_size):
+            yield b"".join(
+                UserPublic.model_validate(row._mapping).model_dump_json().encode("utf-8") + b"\n"
+                for row in rows
+            )
+    except Exception as e:
+        logging.error(f"There was issue while streaming your query: {e}")
+        raise e
+
+
 @router.get("/custom-query",
             response_model=list[UserPublic] | UserPublic,
             dependencies=[Depends(validate_internal_secret)])
-def perform_custom_query_from_storage(db_session: SessionDep):
+async def perform_custom_query_from_storage(db_session: SessionDep,
+                                            stream: bool = False,
+                                            batch_size: Annotated[int, Query(ge=1, le=10000)] = 1000):
     query_content = blob_holder_service.get_blob_content(QUERY_BLOB_NAME)
     print(f"Reading QUERY: {query_content}")
 
-    query = text(query_content)
+    query = compiled_custom_queries.get(QUERY_BLOB_NAME)
+    if query is None:
+        raise HTTPException(status_code=503, detail="Custom query is not loaded")
+
+    if stream:
+        # NDJSON written batch by batch from a server-side cursor
+        return StreamingResponse(
+            stream_query_results(db_session, query, batch_size),
+            media_type="application/x-ndjson"
+        )
 
     try:
-        query_result = db_session.connection().execute(query).fetchall()
+        connection = await db_session.connection()
+        query_result = (await connection.execute(query)).fetchall()
     except Exception as e:
         logging.error(f"There was issue while executing your query: {e}")
         raise e
@@ -38,52 +115,164 @@ def perform_custom_query_from_storage(db_session: SessionDep):
     return query_result
 
 
+async def read_validated_batches(request: Request, schema: type[UserBase], batch_size: int,
+                                 exclude_unset: bool = False) -> AsyncGenerator[list[dict], None]:
+    batch: list[dict] = []
+    index = 0
+    try:
+        async for record in read_json_records(request):
+            batch.append(schema.model_validate(record).model_dump(exclude_unset=exclude_unset))
+            index += 1
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    except ValueError as e:
+        # pydantic ValidationError is a ValueError as well
+        errors = e.errors(include_url=False) if isinstance(e, ValidationError) else str(e)
+        raise HTTPException(status_code=422, detail={"record": index, "errors": errors})
+    if batch:
+        yield batch
+
+
+# bulk routes are declared before /{user_id}, which would match "bulk" otherwise
+@router.post("/bulk")
+async def create_users_bulk(request: Request, db_session: SessionDep, batch_size: BatchSize = BULK_BATCH_SIZE):
+    """
+    Creates users from a JSON array or an NDJSON stream (Content-Type: application/x-ndjson)
+    with one multi-row INSERT per batch, all in one transaction. Returns generated ids in input order.
+    """
+    ids: list[int] = []
+    async with transaction(db_session, User) as rollup_changes:
+        async for batch in read_validated_batches(request, UserBase, batch_size):
+            ids.extend(await bulk_insert(db_session, User, batch))
+        await rollup_changes.collect(User, ids)
+    return {"ids": ids}
+
+
+@router.patch("/bulk")
+async def update_users_bulk(request: Request, db_session: SessionDep, batch_size: BatchSize = BULK_BATCH_SIZE):
+    """
+    Updates users from a JSON array or an NDJSON stream of objects with id and the fields to change.
+    """
+    rows: list[dict] = []
+    async for batch in read_validated_batches(request, UserBulkUpdate, batch_size, exclude_unset=True):
+        rows.extend(batch)
+
+    ids = {row["id"] for row in rows}
+    found = set()
+    for batch in batched(ids, batch_size):
+        found.update((await db_session.exec(select(User.id).where(User.id.in_(batch)))).all())   # type: ignore
+    missing = sorted(ids - found)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Users not found: {missing}")
+
+    updated = 0
+    async with transaction(db_session, User) as rollup_changes:
+        await rollup_changes.collect(User, list(ids))
+        for batch in batched(rows, batch_size):
+            updated += await bulk_update(db_session, User, batch)
+        await rollup_changes.collect(User, list(ids))
+    return {"ok": True, "updated": updated}
+
+
+@router.delete("/bulk")
+async def delete_users_bulk(db_session: SessionDep, ids: list[int] = Body(...), batch_size: BatchSize = BULK_BATCH_SIZE):
+    deleted = 0
+    async with transaction(db_session, User, Purchase) as rollup_changes:
+        await rollup_changes.collect(User, ids)
+        for batch in batched(ids, batch_size):
+            deleted += await bulk_delete(db_session, User, batch)
+    return {"ok": True, "deleted": deleted}
+
+
 @router.get("/{user_id}", response_model=UserPublic)
-def get_user_by_id(user_id: str, db_session: SessionDep):
-    user = db_session.get(User, user_id)
+async def get_user_by_id(user_id: str, request: Request, db_session: SessionDep, load_options: UserLoadOptions):
+    # answered from the stored table versions alone, before the users or the cache are read
+    versions = table_versions.snapshot()
+    etag = await table_etag(db_session, USER_TABLES)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return not_modified(etag)
+    validators = validator_headers(etag)
+
+    cached = cached_response(request, validators)
+    if cached is not None:
+        return cached
+
+    user = await db_session.get(User, user_id, options=load_options.options)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    body = UserPublic.model_validate(user).model_dump_json(exclude=load_options.excluded).encode("utf-8")
+    return cache_response(request, body, versions, validators)
 
 
 @router.get("/", response_model=list[UserPublic])
-def get_all_users(db_session: SessionDep,
-                  offset: int = 0,
-                  limit: Annotated[int, Query(le=100)] = 100):
-    users = db_session.exec(select(User).offset(offset).limit(limit)).all()
-    return users
+async def get_all_users(db_session: SessionDep,
+                        request: Request,
+                        load_options: UserListLoadOptions,
+                        offset: int = 0,
+                        limit: Annotated[int, Query(le=100)] = 100,
+                        after: str | None = None):
+    versions = table_versions.snapshot()
+    etag = await table_etag(db_session, USER_TABLES)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return not_modified(etag)
+    validators = validator_headers(etag)
+
+    cached = cached_response(request, validators)
+    if cached is not None:
+        return cached
+
+    order = keyset_order(User, [])
+    try:
+        query = apply_keyset(select(User).options(*load_options.options), User, order, after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    users = (await db_session.exec(query.offset(offset).limit(limit))).all()
+    headers = {}
+    if users and len(users) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(order, users[-1])
+    body = UserPublicList.dump_json([UserPublic.model_validate(user) for user in users],
+                                   exclude={"__all__": load_options.excluded})
+    return cache_response(request, body, versions, validators, headers)
 
 
 @router.post("/", response_model=UserPublic)
 async def create_user(user_data: UserBase, db_session: SessionDep):
     db_user = User.model_validate(user_data)
-    db_session.add(db_user)
-    db_session.commit()
-    db_session.refresh(db_user)
+    async with transaction(db_session, User) as rollup_changes:
+        db_session.add(db_user)
+        # flushed first, rollups need the generated id
+        await db_session.flush()
+        await rollup_changes.collect(User, [db_user.id])
+    await db_session.refresh(db_user, ["purchases"])
     return db_user
 
 
 @router.patch("/{user_id}", response_model=UserPublic)
 async def update_user(user_id: int, new_user_data: UserUpdate, db_session: SessionDep):
-    user_db = db_session.get(User, user_id)
+    user_db = await db_session.get(User, user_id, options=[selectinload(User.purchases)])
     if not user_db:
         raise HTTPException(status_code=404, detail="Hero not found")
 
     user_data = new_user_data.model_dump(exclude_unset=True)
-    user_db.sqlmodel_update(user_data)
-
-    db_session.add(user_db)
-    db_session.commit()
-    db_session.refresh(user_db)
+    async with transaction(db_session, User) as rollup_changes:
+        await rollup_changes.collect(User, [user_id])
+        user_db.sqlmodel_update(user_data)
+        db_session.add(user_db)
+        await rollup_changes.collect(User, [user_id])
+    await db_session.refresh(user_db)
 
     return user_db
 
 
 @router.delete("/{user_id}")
-def delete_user(user_id: int, db_session: SessionDep):
-    user = db_session.get(User, user_id)
+async def delete_user(user_id: int, db_session: SessionDep):
+    user = await db_session.get(User, user_id, options=[selectinload(User.purchases)])
     if not user:
         raise HTTPException(status_code=404, detail="USer not found")
-    db_session.delete(user)
-    db_session.commit()
+    async with transaction(db_session, User, Purchase) as rollup_changes:
+        await rollup_changes.collect(User, [user_id])
+        await rollup_changes.collect(Purchase, [purchase.id for purchase in user.purchases])
+        await db_session.delete(user)
     return {"ok": True}
@@ -0,0 +1,147 @@
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from sqlalchemy import event, Table
+from sqlalchemy.sql.util import find_tables
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.requests import Request
+from starlette.responses import Response
+import threading
+import logging
+import time
+import re
+
+from api.config.envs import SQL_N_PLUS_ONE_THRESHOLD
+
+
+# bind parameter lists of IN (...) and multi-row VALUES differ in length between requests
+PARAMETER_LIST_PATTERN = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,?)+\)(?:\s*,\s*\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,?)+\))*")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    return PARAMETER_LIST_PATTERN.sub("(?)", WHITESPACE_PATTERN.sub(" ", statement).strip())
+
+
+@dataclass
+class RequestSqlStats:
+    statements: int = 0
+    db_seconds: float = 0.0
+    shapes: Counter = field(default_factory=Counter)
+    operation_name: str | None = None
+
+    def repeated_shapes(self, threshold: int = SQL_N_PLUS_ONE_THRESHOLD) -> list[tuple[str, int]]:
+        """
+        Statements run more than threshold times in one request, likely queries issued per row (N+1).
+        """
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+current_sql_stats: ContextVar[RequestSqlStats | None] = ContextVar("current_sql_stats", default=None)
+# (statement, seconds) of statements run by the code currently traced, e.g. one GraphQL resolver
+current_sql_trace: ContextVar[list[tuple[str, float]] | None] = ContextVar("current_sql_trace", default=None)
+# names of tables read by the code currently collecting them, e.g. a cached GraphQL operation
+current_read_tables: ContextVar[set[str] | None] = ContextVar("current_read_tables", default=None)
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    if current_sql_stats.get() is not None or current_sql_trace.get() is not None:
+        context._instrumentation_start = time.perf_counter()
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_instrumentation_start", None)
+    if start is None:
+        return
+    seconds = time.perf_counter() - start
+
+    stats = current_sql_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += seconds
+        stats.shapes[statement_shape(statement)] += 1
+    trace = current_sql_trace.get()
+    if trace is not None:
+        trace.append((statement, seconds))
+    read_tables = current_read_tables.get()
+    if read_tables is not None:
+        if context.compiled is None:
+            # textual SQL, tables can't be known
+            read_tables.add("*")
+        else:
+            read_tables.update(
+                table.name for table in find_tables(context.compiled.statement, check_columns=True)
+                if isinstance(table, Table)
+            )
+
+
+def install_sql_instrumentation(engine: AsyncEngine):
+    """
+    Counts statements and database time of the request running them,
+    statements run outside of a request are not recorded.
+    """
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class SqlMetrics:
+    """
+    Totals per route and GraphQL operation name, exported in Prometheus format.
+    Operation names come from clients, so the number of series is capped.
+    """
+    MAX_SERIES = 500
+
+    def __init__(self):
+        self._series: dict[tuple[str, str], dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, operation: str, stats: RequestSqlStats, request_seconds: float, n_plus_one: int):
+        with self._lock:
+            key = (route, operation)
+            if key not in self._series and len(self._series) >= self.MAX_SERIES:
+                key = (route, "other")
+            series = self._series.setdefault(key, dict.fromkeys(
+                ("requests", "request_seconds", "statements", "db_seconds", "n_plus_one"), 0.0
+            ))
+            series["requests"] += 1
+            series["request_seconds"] += request_seconds
+            series["statements"] += stats.statements
+            series["db_seconds"] += stats.db_seconds
+            series["n_plus_one"] += n_plus_one
+
+    def snapshot(self) -> dict[tuple[str, str], dict[str, float]]:
+        with self._lock:
+            return {key: dict(series) for key, series in self._series.items()}
+
+
+sql_metrics = SqlMetrics()
+
+
+def start_request_stats() -> RequestSqlStats:
+    stats = RequestSqlStats()
+    current_sql_stats.set(stats)
+    return stats
+
+
+def finish_request_stats(request: Request, stats: RequestSqlStats, request_seconds: float):
+    route = request.scope.get("route")
+    route_label = f"{request.method} {route.path}" if route is not None else "unmatched"
+
+    repeated = stats.repeated_shapes()
+    for shape, count in repeated:
+        logging.warning(f"Possible N+1 in {route_label} ({stats.operation_name or '-'}): "
+                        f"statement run {count} times: {shape[:300]}")
+    sql_metrics.record(route_label, stats.operation_name or "", stats, request_seconds, len(repeated))
+
+
+def set_server_timing(response: Response, stats: RequestSqlStats, request_seconds: float):
+    """
+    Headers are sent before the body, so for streamed responses the timing
+    covers only the work done before the first chunk, e.g. not the streamed query.
+    """
+    repeated = stats.repeated_shapes()
+    response.headers["Server-Timing"] = ", ".join([
+        f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.statements} queries"',
+        f"app;dur={request_seconds * 1000:.2f}",
+        *([f'nplusone;desc="{len(repeated)} repeated statements"'] if repeated else [])
+    ])
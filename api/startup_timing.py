@@ -0,0 +1,56 @@
+from contextlib import contextmanager
+from typing import Awaitable, Generator, TypeVar
+import logging
+import time
+import os
+
+
+# Read directly from the environment, api.config.envs is one of the measured phases
+STARTUP_PROFILING: bool = (os.getenv("STARTUP_PROFILING") or "false").lower() == "true"
+STARTUP_BUDGET_SECONDS: float = float(os.getenv("STARTUP_BUDGET_SECONDS") or 0)
+
+T = TypeVar("T")
+
+
+class StartupTimer:
+    """
+    Collects durations of cold start phases (imports, env validation, schema
+    construction, blob loads, table creation...). Phases running concurrently
+    are measured separately, so their sum can exceed the wall time.
+    The total is the wall time until the first report, at the end of the lifespan.
+    Phases deferred to the first request (schema construction) are added to it
+    on their own, the idle time before that request is not startup time.
+    """
+    def __init__(self) -> None:
+        self.phases: dict[str, float] = {}
+        self.process_start = time.perf_counter()
+        self.total: float | None = None
+
+    @contextmanager
+    def phase(self, name: str) -> Generator[None, None, None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + duration
+            if self.total is not None:
+                self.total += duration
+
+    async def measure(self, name: str, awaitable: Awaitable[T]) -> T:
+        with self.phase(name):
+            return await awaitable
+
+    def report(self, title: str = "Startup timings"):
+        if self.total is None:
+            self.total = time.perf_counter() - self.process_start
+        total = self.total
+        if STARTUP_PROFILING:
+            lines = [f"{title} (total {total:.3f}s):"]
+            lines += [f"  {name}: {seconds:.3f}s" for name, seconds in self.phases.items()]
+            logging.info("\n".join(lines))
+        if STARTUP_BUDGET_SECONDS and total > STARTUP_BUDGET_SECONDS:
+            logging.warning(f"Startup took {total:.3f}s, over the budget of {STARTUP_BUDGET_SECONDS}s")
+
+
+startup_timer = StartupTimer()
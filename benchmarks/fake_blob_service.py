@@ -0,0 +1,71 @@
+from azure.core.exceptions import ResourceNotFoundError, ResourceNotModifiedError
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import AsyncIterator
+import hashlib
+
+
+class FakeDownloader:
+    """
+    In-memory stand-in for azure StorageStreamDownloader with the members the app uses.
+    """
+    def __init__(self, content: bytes, etag: str, total_size: int, offset: int):
+        self.content = content
+        self.size = len(content)
+        end = offset + self.size - 1
+        self.properties = SimpleNamespace(
+            etag=etag,
+            last_modified=datetime(2024, 1, 1, tzinfo=timezone.utc),
+            content_range=f"bytes {offset}-{end}/{total_size}",
+            content_settings=SimpleNamespace(content_type="application/octet-stream")
+        )
+
+    async def readall(self) -> bytes:
+        return self.content
+
+    async def chunks(self, chunk_size: int = 4 * 1024 * 1024) -> AsyncIterator[bytes]:
+        for start in range(0, self.size, chunk_size):
+            yield self.content[start:start + chunk_size]
+
+
+class FakeBlobService:
+    """
+    AsyncBlobService replacement serving blobs from a dict, so benchmarks don't need Azure.
+    """
+    def __init__(self, blobs: dict[str, bytes]):
+        self.blobs = blobs
+
+    def _etag(self, blob_name: str) -> str:
+        return f'"{hashlib.md5(self.blobs[blob_name]).hexdigest()}"'
+
+    async def download_blob(self, blob_name: str) -> bytes:
+        return await (await self.download_blob_stream(blob_name)).readall()
+
+    async def download_blobs(self, blob_names: list[str]) -> dict[str, bytes]:
+        return {blob_name: await self.download_blob(blob_name) for blob_name in blob_names}
+
+    async def download_blob_stream(self, blob_name: str, offset: int | None = None, length: int | None = None,
+                                   if_none_match: str | None = None) -> FakeDownloader:
+        if blob_name not in self.blobs:
+            raise ResourceNotFoundError(f"Blob {blob_name} not found")
+        etag = self._etag(blob_name)
+        if if_none_match == etag:
+            raise ResourceNotModifiedError("Blob not modified")
+        content = self.blobs[blob_name]
+        start = offset or 0
+        end = len(content) if length is None else start + length
+        return FakeDownloader(content[start:end], etag, len(content), start)
+
+    async def download_blob_if_modified(self, blob_name: str, etag: str | None) -> FakeDownloader | None:
+        try:
+            return await self.download_blob_stream(blob_name, if_none_match=etag)
+        except ResourceNotModifiedError:
+            return None
+
+    async def get_blob_etag(self, blob_name: str) -> str:
+        if blob_name not in self.blobs:
+            raise ResourceNotFoundError(f"Blob {blob_name} not found")
+        return self._etag(blob_name)
+
+    async def close(self):
+        pass
@@ -0,0 +1,248 @@
+"""
+Offline benchmark of the REST and GraphQL hot paths.
+
+    python -m benchmarks.run --sizes 1000,10000,100000,1000000 --requests 200 --concurrency 10
+
+The app runs in-process against a seeded SQLite database (or DATABASE_CONNECTION_STRING
+when it is set, e.g. a local MySQL) and a fake blob service, so neither Azure nor a network
+is needed. Latency percentiles, throughput and SQL queries per request of every scenario
+are printed and stored in benchmarks/results/. With --baseline the run is compared
+with an earlier result and fails when p50 latency regresses more than --max-regression percent.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+RESULTS_DIR = Path(__file__).parent / "results"
+INTERNAL_SECRET = "benchmark-secret"
+CUSTOM_QUERY = "SELECT * FROM user LIMIT 1000"
+LARGE_BLOB_SIZE = 1024 * 1024
+
+# name: (method, url, json body)
+SCENARIOS: dict[str, tuple[str, str, dict | None]] = {
+    "rest_users": ("GET", "/users/?limit=100", None),
+    "rest_users_without_purchases": ("GET", "/users/?limit=100&expand=-purchases", None),
+    "rest_custom_query": ("GET", "/users/custom-query", None),
+    "rest_custom_query_stream": ("GET", "/users/custom-query?stream=true", None),
+    "graphql_users": ("POST", "/graphql", {
+        "query": "{ users(limit: 100) { id name age purchases { id item { price } } } }"
+    }),
+    "graphql_users_filtered": ("POST", "/graphql", {
+        "query": "{ users(limit: 100, where: {age: {gte: 30, lt: 40}}) { id name age } }"
+    }),
+    "graphql_users_connection": ("POST", "/graphql", {
+        "query": "{ usersConnection(first: 100) { edges { cursor node { id name } } pageInfo { hasNextPage } } }"
+    }),
+    "graphql_purchases_grouped_nodes": ("POST", "/graphql", {
+        "query": "{ purchasesGrouped(groupBy: [\"item_id\"], limit: 10) "
+                 "{ keys { value } aggregate { count sum { userId } } nodes { id userId } } }"
+    }),
+    "graphql_users_grouped_aggregates": ("POST", "/graphql", {
+        "query": "{ usersGrouped(groupBy: [\"age\"]) { keys { value } aggregate { count avg { age } } } }"
+    }),
+    "files_json": ("GET", "/files/config.txt", None),
+    "files_stream": ("GET", "/files/large.bin?stream=true", None),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark REST and GraphQL endpoints on a seeded database")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma separated numbers of users (and purchases) to seed, e.g. 1000,1000000")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10, help="requests in flight at once")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated scenarios to run")
+    parser.add_argument("--database", default=os.path.join(tempfile.gettempdir(), "azfunctions-benchmark.sqlite"),
+                        help="SQLite file used when DATABASE_CONNECTION_STRING is not set")
+    parser.add_argument("--output", default=None, help="result file, benchmarks/results/<timestamp>.json by default")
+    parser.add_argument("--baseline", default=None, help="earlier result file to compare with")
+    parser.add_argument("--max-regression", type=float, default=20.0,
+                        help="allowed p50 latency increase against the baseline, in percent")
+    return parser.parse_args()
+
+
+def configure_environment(database_path: str):
+    # has to run before api is imported, api.config.envs validates these on import
+    defaults = {
+        "INTERNAL_SECRET": INTERNAL_SECRET,
+        "STORAGE_CONTAINER_NAME": "benchmark",
+        "CONFIG_BLOB_NAME": "config.txt",
+        "QUERY_BLOB_NAME": "query.sql",
+        "AzureWebJobsStorage__accountName": "benchmark",
+        "DATABASE_CONNECTION_STRING": f"sqlite:///{database_path}",
+        # repeated requests would be served from memory instead of measuring the resolvers
+        "RESULT_CACHE_ENABLED": "false",
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+
+
+def summarize(latencies: list[float], wall_seconds: float, queries: int, errors: int) -> dict:
+    cut_points = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": cut_points[49] * 1000,
+        "p90_ms": cut_points[89] * 1000,
+        "p99_ms": cut_points[98] * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "throughput_rps": len(latencies) / wall_seconds,
+        "queries_per_request": queries / len(latencies),
+    }
+
+
+async def run_scenario(client, name: str, requests: int, warmup: int, concurrency: int, sql_counter: list[int]) -> dict:
+    method, url, body = SCENARIOS[name]
+    headers = {"X-Internal-Secret": INTERNAL_SECRET}
+
+    async def send() -> bool:
+        response = await client.request(method, url, json=body, headers=headers)
+        await response.aread()
+        if response.status_code >= 400:
+            return False
+        # GraphQL reports errors with status 200
+        return not (url.startswith("/graphql") and response.json().get("errors"))
+
+    for _ in range(warmup):
+        await send()
+
+    latencies: list[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            ok = await send()
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    queries_before = sql_counter[0]
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall_seconds = time.perf_counter() - start
+    return summarize(latencies, wall_seconds, sql_counter[0] - queries_before, errors)
+
+
+async def run_size(size: int, scenarios: list[str], args) -> dict:
+    import httpx
+    from sqlalchemy import event
+    import api.main
+    from api.database import all_engines
+    from benchmarks.seed import seed_database
+    from benchmarks.fake_blob_service import FakeBlobService
+
+    print(f"Seeding {size} users...", flush=True)
+    seeded = seed_database(os.environ["DATABASE_CONNECTION_STRING"], size)
+
+    blob_service = FakeBlobService({
+        os.environ["CONFIG_BLOB_NAME"]: b"benchmark config",
+        os.environ["QUERY_BLOB_NAME"]: CUSTOM_QUERY.encode("utf-8"),
+        "large.bin": os.urandom(LARGE_BLOB_SIZE),
+    })
+    api.main.get_shared_blob_service = lambda: blob_service     # type: ignore
+
+    sql_counter = [0]
+    def count_statement(*args):
+        sql_counter[0] += 1
+    for engine in all_engines:
+        event.listen(engine.sync_engine, "before_cursor_execute", count_statement)
+
+    results = {}
+    try:
+        async with api.main.app.router.lifespan_context(api.main.app):
+            transport = httpx.ASGITransport(app=api.main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                for name in scenarios:
+                    results[name] = await run_scenario(
+                        client, name, args.requests, args.warmup, args.concurrency, sql_counter
+                    )
+                    print_result(size, name, results[name])
+    finally:
+        for engine in all_engines:
+            event.remove(engine.sync_engine, "before_cursor_execute", count_statement)
+            # connections to the old database file must not be reused after reseeding
+            await engine.dispose()
+    return {"seeded": seeded, "scenarios": results}
+
+
+def print_result(size: int, name: str, result: dict):
+    print(
+        f"{size:>9} {name:<34} p50 {result['p50_ms']:8.2f}ms  p90 {result['p90_ms']:8.2f}ms  "
+        f"p99 {result['p99_ms']:8.2f}ms  {result['throughput_rps']:8.1f} req/s  "
+        f"{result['queries_per_request']:5.1f} queries/req  {result['errors']} errors",
+        flush=True
+    )
+
+
+def compare_with_baseline(results: dict, baseline_path: str, max_regression: float) -> bool:
+    baseline = json.loads(Path(baseline_path).read_text())["results"]
+    passed = True
+    print(f"\nComparison with {baseline_path}:")
+    for size, size_results in results.items():
+        for name, result in size_results["scenarios"].items():
+            previous = baseline.get(size, {}).get("scenarios", {}).get(name)
+            if previous is None:
+                continue
+            change = (result["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"] * 100
+            queries_change = result["queries_per_request"] - previous["queries_per_request"]
+            regressed = change > max_regression or queries_change > 0
+            passed = passed and not regressed
+            print(f"{size:>9} {name:<34} p50 {change:+7.1f}%  queries/req {queries_change:+5.1f}"
+                  f"{'  REGRESSION' if regressed else ''}")
+    return passed
+
+
+def get_git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    args = parse_args()
+    configure_environment(os.path.abspath(args.database))
+    sizes = [int(size) for size in args.sizes.split(",")]
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {unknown}, available: {list(SCENARIOS)}")
+
+    results = {}
+    for size in sizes:
+        results[str(size)] = asyncio.run(run_size(size, scenarios, args))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "created": datetime.now().isoformat(),
+        "commit": get_git_commit(),
+        "python": platform.python_version(),
+        "database": os.environ["DATABASE_CONNECTION_STRING"].split(":", 1)[0],
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "results": results
+    }, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.baseline and not compare_with_baseline(results, args.baseline, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
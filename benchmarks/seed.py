@@ -0,0 +1,47 @@
+from sqlmodel import SQLModel, create_engine, insert
+from datetime import datetime, timedelta
+
+from api.models import User, Item, Purchase
+
+
+SEED_BATCH_SIZE = 10000
+
+
+def seed_database(connection_string: str, users: int) -> dict[str, int]:
+    """
+    Recreates all tables with `users` users, one purchase per user and one item per 100 purchases,
+    so grouped purchases have ~100 nodes per item regardless of size. Every 10th user has no age.
+    """
+    items = max(10, users // 100)
+    engine = create_engine(connection_string)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+
+    created_at = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        _insert_batched(connection, Item, (
+            {"id": i + 1, "name": f"item-{i}", "price": float(i % 50) + 0.99,
+             "expiration_date": created_at + timedelta(days=i % 365)}
+            for i in range(items)
+        ))
+        _insert_batched(connection, User, (
+            {"id": i + 1, "name": f"user-{i}", "age": None if i % 10 == 0 else 18 + i % 60}
+            for i in range(users)
+        ))
+        _insert_batched(connection, Purchase, (
+            {"id": i + 1, "user_id": i + 1, "item_id": i % items + 1}
+            for i in range(users)
+        ))
+    engine.dispose()
+    return {"users": users, "items": items, "purchases": users}
+
+
+def _insert_batched(connection, model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == SEED_BATCH_SIZE:
+            connection.execute(insert(model.__table__), batch)
+            batch = []
+    if batch:
+        connection.execute(insert(model.__table__), batch)
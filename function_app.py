@@ -3,7 +3,7 @@ from azure.functions.decorators import BlobSource
 import logging
 
 from api import app
-from api.external_services.blob_storage_service import create_blob_service
+from api.external_services.async_blob_storage_service import get_shared_blob_service
 from api.config.envs import STORAGE_CONTAINER_NAME, CONFIG_BLOB_NAME, QUERY_BLOB_NAME
 from api.config.BlobHolderService import BlobHolderService
 
@@ -31,12 +31,23 @@ def handle_config_file_update(config_file: func.InputStream):
 @app.timer_trigger(schedule="30 * * * * *", 
                    arg_name="functiontimer",
                    run_on_startup=False) 
-def test_function(functiontimer: func.TimerRequest) -> None:
-   blob_service = create_blob_service()
+async def test_function(functiontimer: func.TimerRequest) -> None:
+   blob_service = get_shared_blob_service()
 
    try:
-      updated_config_file_content = blob_service.download_blob(QUERY_BLOB_NAME).decode('utf-8')
-      blob_holder_service.update_blob_content(QUERY_BLOB_NAME, updated_config_file_content)
-      logging.info("Updated query file after timer trigger")
+      snapshot = blob_holder_service.get_snapshot(QUERY_BLOB_NAME)
+      blob_stream = await blob_service.download_blob_if_modified(QUERY_BLOB_NAME, snapshot.etag if snapshot else None)
+      if blob_stream is None:
+         logging.info("Query file not modified")
+         return
+
+      changed = blob_holder_service.update_blob_content(
+         QUERY_BLOB_NAME,
+         (await blob_stream.readall()).decode('utf-8'),
+         etag=blob_stream.properties.etag,
+         last_modified=blob_stream.properties.last_modified
+      )
+      if changed:
+         logging.info("Updated query file after timer trigger")
    except Exception as e:
       logging.error(f"Error while updating query file after timer trigger: {e}")
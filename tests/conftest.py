@@ -0,0 +1,13 @@
+import os
+
+
+# api.config.envs validates these on import
+for name, value in {
+    "INTERNAL_SECRET": "test-secret",
+    "STORAGE_CONTAINER_NAME": "test",
+    "CONFIG_BLOB_NAME": "config.txt",
+    "QUERY_BLOB_NAME": "query.sql",
+    "AzureWebJobsStorage__accountName": "test",
+    "DATABASE_CONNECTION_STRING": "sqlite://",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,60 @@
+import pytest
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from api.http_caching import table_etag, bump_table_versions, ensure_table_versions
+from api.models import User
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def sessions(tmp_path):
+    # a database file, so every session has a connection of its own like separate instances
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite'}")
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as db_session:
+        await ensure_table_versions(db_session)
+    yield session_factory
+    await engine.dispose()
+
+
+async def read_etag(sessions, tables: tuple[str, ...] = ("user", "purchase")) -> str:
+    async with sessions() as db_session:
+        return await table_etag(db_session, tables)
+
+
+@pytest.mark.anyio
+async def test_table_etag_changes_on_commit_only(sessions):
+    before = await read_etag(sessions)
+    assert await read_etag(sessions) == before
+
+    async with sessions() as db_session:
+        await bump_table_versions(db_session, User)
+        # not committed yet, other sessions still see the old version
+        assert await read_etag(sessions) == before
+        await db_session.commit()
+    after = await read_etag(sessions)
+    assert after != before
+    assert await read_etag(sessions) == after
+
+    async with sessions() as db_session:
+        await bump_table_versions(db_session, User)
+        await db_session.rollback()
+    assert await read_etag(sessions) == after
+
+
+@pytest.mark.anyio
+async def test_table_etag_depends_only_on_the_given_tables(sessions):
+    before = await read_etag(sessions, ("item",))
+
+    async with sessions() as db_session:
+        await bump_table_versions(db_session, User)
+        await db_session.commit()
+    assert await read_etag(sessions, ("item",)) == before
@@ -0,0 +1,12 @@
+from decimal import Decimal
+from types import SimpleNamespace
+
+from api.pagination import encode_cursor, decode_cursor
+
+
+def test_grouped_cursor_with_decimal_aggregate():
+    # ordered by a SUM aggregate, as MySQL returns it, then by the group key
+    order = [("agg_0", True), ("key_0", False)]
+    row = SimpleNamespace(agg_0=Decimal("12345678901234567890.15"), key_0=3)
+
+    assert decode_cursor(order, encode_cursor(order, row)) == [Decimal("12345678901234567890.15"), 3]
@@ -0,0 +1,70 @@
+import struct
+
+from api.config.SharedBlobStore import SharedBlobStore, INITIAL_SIZE, SEQUENCE_OFFSET
+
+
+def read_sequence(store: SharedBlobStore) -> int:
+    return struct.unpack_from("<Q", store._mmap, SEQUENCE_OFFSET)[0]
+
+
+def test_publish_is_read_by_another_store_on_the_same_file(tmp_path):
+    path = str(tmp_path / "blobs")
+    writer, reader = SharedBlobStore(path), SharedBlobStore(path)
+
+    snapshot, changed = writer.publish("config.txt", "a", etag='"1"')
+    assert changed and snapshot.version == 1
+    assert reader.read_if_changed() == [snapshot]
+    # nothing published since, only the header was compared
+    assert reader.read_if_changed() is None
+
+    writer.publish("config.txt", "b", etag='"2"')
+    [updated] = reader.read_if_changed()
+    assert (updated.content, updated.version, updated.etag) == ("b", 2, '"2"')
+
+
+def test_publishing_the_same_content_keeps_the_version(tmp_path):
+    store = SharedBlobStore(str(tmp_path / "blobs"))
+    store.publish("config.txt", "a")
+
+    snapshot, changed = store.publish("config.txt", "a")
+    assert not changed and snapshot.version == 1
+
+
+def test_write_abandoned_by_a_dead_writer_is_recovered_by_readers(tmp_path):
+    path = str(tmp_path / "blobs")
+    writer, reader = SharedBlobStore(path), SharedBlobStore(path)
+    writer.publish("config.txt", "a")
+    # a writer dying after making the sequence odd, its payload half written
+    struct.pack_into("<Q", writer._mmap, SEQUENCE_OFFSET, read_sequence(writer) + 1)
+
+    assert reader.read_if_changed() is None
+    assert read_sequence(reader) % 2 == 0
+    assert reader.read_if_changed() == []
+
+    snapshot, changed = reader.publish("config.txt", "b")
+    assert changed and writer.read_if_changed() == [snapshot]
+
+
+def test_write_abandoned_by_a_dead_writer_is_recovered_on_open(tmp_path):
+    path = str(tmp_path / "blobs")
+    writer = SharedBlobStore(path)
+    writer.publish("config.txt", "a")
+    struct.pack_into("<Q", writer._mmap, SEQUENCE_OFFSET, read_sequence(writer) + 1)
+
+    opened = SharedBlobStore(path)
+    assert read_sequence(opened) % 2 == 0
+    assert opened.read_if_changed() == []
+
+
+def test_store_grows_and_other_stores_remap(tmp_path):
+    path = str(tmp_path / "blobs")
+    writer, reader = SharedBlobStore(path), SharedBlobStore(path)
+    reader.read_if_changed()
+    content = "x" * (INITIAL_SIZE + 1)
+
+    writer.publish("query.sql", content)
+    assert len(writer._mmap) > INITIAL_SIZE
+
+    [snapshot] = reader.read_if_changed()
+    assert snapshot.content == content
+    assert len(reader._mmap) == len(writer._mmap)